@@ -2,29 +2,21 @@ import asyncio
 from datetime import datetime, timedelta
 import uuid
 from fastapi import Request
-from passlib.context import CryptContext
 from sqlmodel import select
-from src.apps.accounts.enum import ActivityType
-from src.apps.accounts.models import Activities, User
+from src.apps.accounts.enum import ActivityType, UserLoadProfile
+from src.apps.accounts.models import Activities, User, user_load_options
 from src.apps.accounts.services import UserServices
 from src.db.engine import get_session
 from src.errors import ReferrerNotFound
-from src.utils.hashing import createAccessToken
+from src.utils.hashing import createAccessToken, generateHashKeyAsync
 from src.utils.logger import LOGGER
 
-# Password hashing setup
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 user_services = UserServices()
 
 # Function to get user input asynchronously
 async def get_input(prompt: str) -> str:
     return await asyncio.to_thread(input, prompt)
 
-# Function to hash password asynchronously
-async def hash_password(password: str) -> str:
-    return await asyncio.to_thread(pwd_context.hash, password)
-
 async def create_superuser():
     async for session in get_session():
         # Get user input asynchronously
@@ -33,7 +25,7 @@ async def create_superuser():
 
         # Check if user already exists
         result = await session.exec(
-            select(User).where(User.userId == userId)
+            select(User).where(User.userId == userId).options(*user_load_options(UserLoadProfile.AUTH))
         )
         existing_user = result.first()
 
@@ -42,7 +34,7 @@ async def create_superuser():
             return
 
         # Hash password asynchronously
-        hashed_password = await hash_password(password)
+        hashed_password = await generateHashKeyAsync(password)
 
         # Create superuser
         superuser = User(
@@ -7,6 +7,7 @@ from sqlalchemy.ext.asyncio import async_engine_from_config
 from sqlmodel import SQLModel
 
 from src.apps.accounts.models import User, UserReferral, UserStaking, UserWallet, MatrixPool, MatrixPoolUsers, TokenMeter, Activities, PendingTransactions
+from src.db.partitions import ACTIVITY_PARTITION_PATTERN
 
 from alembic import context
 
@@ -25,6 +26,13 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = SQLModel.metadata
 
+def include_object(object, name, type_, reflected, compare_to):
+    # the monthly activities partitions are managed by src.db.partitions, not the models
+    if type_ == "table" and reflected and ACTIVITY_PARTITION_PATTERN.fullmatch(name):
+        return False
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -49,6 +57,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         render_as_batch=True,
+        include_object=include_object,
         dialect_opts={"paramstyle": "named"},
     )
 
@@ -57,7 +66,7 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True)
+    context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True, include_object=include_object)
 
     with context.begin_transaction():
         context.run_migrations()
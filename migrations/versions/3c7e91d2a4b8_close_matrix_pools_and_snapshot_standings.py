@@ -0,0 +1,55 @@
+"""close matrix pools and snapshot their standings
+
+Revision ID: 3c7e91d2a4b8
+Revises: 81a1d43034c4
+Create Date: 2026-10-19 14:05:31.482917
+
+"""
+from typing import Sequence, Union
+import sqlmodel
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '3c7e91d2a4b8'
+down_revision: Union[str, None] = '81a1d43034c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('matrix_pool', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('closedAt', postgresql.TIMESTAMP(), nullable=True))
+
+    op.create_table('matrix_pool_snapshots',
+    sa.Column('uid', sa.UUID(), nullable=False),
+    sa.Column('matrixPoolUid', sa.Uuid(), nullable=False),
+    sa.Column('userId', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('position', sa.Integer(), nullable=True),
+    sa.Column('referralsAdded', sa.Integer(), nullable=False),
+    sa.Column('matrixShare', sa.Numeric(scale=2), nullable=False),
+    sa.Column('matrixEarninig', sa.Numeric(scale=9), nullable=False),
+    sa.Column('startDate', postgresql.TIMESTAMP(), nullable=False),
+    sa.Column('endDate', postgresql.TIMESTAMP(), nullable=False),
+    sa.ForeignKeyConstraint(['matrixPoolUid'], ['matrix_pool.uid'], ),
+    sa.PrimaryKeyConstraint('uid'),
+    sa.UniqueConstraint('uid'),
+    sa.UniqueConstraint('matrixPoolUid', 'userId', name='uq_matrix_pool_snapshots_pool_user')
+    )
+    op.create_index(op.f('ix_matrix_pool_snapshots_matrixPoolUid'), 'matrix_pool_snapshots', ['matrixPoolUid'], unique=False)
+    op.create_index(op.f('ix_matrix_pool_snapshots_userId'), 'matrix_pool_snapshots', ['userId'], unique=False)
+
+    # pools that ended before the rollover existed were settled by the old weekly job
+    op.execute('UPDATE matrix_pool SET "closedAt" = "endDate" WHERE "endDate" <= now()')
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_matrix_pool_snapshots_userId'), table_name='matrix_pool_snapshots')
+    op.drop_index(op.f('ix_matrix_pool_snapshots_matrixPoolUid'), table_name='matrix_pool_snapshots')
+    op.drop_table('matrix_pool_snapshots')
+
+    with op.batch_alter_table('matrix_pool', schema=None) as batch_op:
+        batch_op.drop_column('closedAt')
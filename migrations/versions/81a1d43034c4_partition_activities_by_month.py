@@ -0,0 +1,73 @@
+"""partition activities by month
+
+Revision ID: 81a1d43034c4
+Revises: 6b6cae16f40a
+Create Date: 2026-10-19 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+import sqlmodel
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '81a1d43034c4'
+down_revision: Union[str, None] = '6b6cae16f40a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# one partition per month from the oldest activity through two months from now, the
+# daily job keeps creating them from here on (src.db.partitions)
+CREATE_PARTITIONS = """
+DO $$
+DECLARE
+    month date;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', coalesce((SELECT min(created) FROM activities_unpartitioned), now() AT TIME ZONE 'utc')),
+            date_trunc('month', now() AT TIME ZONE 'utc' + interval '2 months'),
+            interval '1 month'
+        )::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF activities FOR VALUES FROM (%L) TO (%L)',
+            'activities_' || to_char(month, 'YYYY_MM'), month, (month + interval '1 month')::date
+        );
+    END LOOP;
+END $$;
+"""
+
+
+def upgrade() -> None:
+    op.execute('ALTER TABLE activities RENAME TO activities_unpartitioned')
+    op.execute('ALTER INDEX IF EXISTS activities_pkey RENAME TO activities_unpartitioned_pkey')
+    op.execute('ALTER INDEX IF EXISTS activities_uid_key RENAME TO activities_unpartitioned_uid_key')
+    # the partition key has to be set on every row
+    op.execute("UPDATE activities_unpartitioned SET created = now() AT TIME ZONE 'utc' WHERE created IS NULL")
+
+    op.execute('CREATE TABLE activities (LIKE activities_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (created)')
+    op.execute('ALTER TABLE activities ALTER COLUMN created SET NOT NULL')
+    op.create_primary_key('activities_pkey', 'activities', ['uid', 'created'])
+    op.create_foreign_key('activities_userUid_fkey', 'activities', 'users', ['userUid'], ['uid'])
+    op.execute('CREATE INDEX "ix_activities_userUid_created" ON activities ("userUid", created DESC)')
+    op.execute('CREATE INDEX "ix_activities_activityType_created" ON activities ("activityType", created DESC)')
+    op.execute(CREATE_PARTITIONS)
+
+    op.execute('INSERT INTO activities SELECT * FROM activities_unpartitioned')
+    op.execute('DROP TABLE activities_unpartitioned')
+
+
+def downgrade() -> None:
+    # partitions that were detached are left untouched and are not copied back
+    op.execute('CREATE TABLE activities_unpartitioned (LIKE activities INCLUDING DEFAULTS)')
+    op.execute('INSERT INTO activities_unpartitioned SELECT * FROM activities')
+    op.execute('DROP TABLE activities')
+
+    op.execute('ALTER TABLE activities_unpartitioned RENAME TO activities')
+    op.execute('ALTER TABLE activities ALTER COLUMN created DROP NOT NULL')
+    op.create_primary_key('activities_pkey', 'activities', ['uid'])
+    op.create_foreign_key('activities_userUid_fkey', 'activities', 'users', ['userUid'], ['uid'])
@@ -0,0 +1,43 @@
+"""matrix pool payout ledger
+
+Revision ID: 9e2d4b7f1c35
+Revises: 3c7e91d2a4b8
+Create Date: 2026-10-19 14:32:08.913640
+
+"""
+from typing import Sequence, Union
+import sqlmodel
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '9e2d4b7f1c35'
+down_revision: Union[str, None] = '3c7e91d2a4b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('matrix_pool_payouts',
+    sa.Column('uid', sa.UUID(), nullable=False),
+    sa.Column('matrixPoolUid', sa.Uuid(), nullable=False),
+    sa.Column('userUid', sa.Uuid(), nullable=False),
+    sa.Column('userId', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('amount', sa.Numeric(scale=9), nullable=False),
+    sa.Column('matrixShare', sa.Numeric(scale=2), nullable=False),
+    sa.Column('created', postgresql.TIMESTAMP(), nullable=True),
+    sa.Column('appliedAt', postgresql.TIMESTAMP(), nullable=True),
+    sa.ForeignKeyConstraint(['matrixPoolUid'], ['matrix_pool.uid'], ),
+    sa.ForeignKeyConstraint(['userUid'], ['users.uid'], ),
+    sa.PrimaryKeyConstraint('uid'),
+    sa.UniqueConstraint('uid'),
+    sa.UniqueConstraint('matrixPoolUid', 'userUid', name='uq_matrix_pool_payouts_pool_user')
+    )
+    op.create_index(op.f('ix_matrix_pool_payouts_matrixPoolUid'), 'matrix_pool_payouts', ['matrixPoolUid'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_matrix_pool_payouts_matrixPoolUid'), table_name='matrix_pool_payouts')
+    op.drop_table('matrix_pool_payouts')
@@ -0,0 +1,48 @@
+"""admin statistics rollups
+
+Revision ID: b6f03a8e5d21
+Revises: 9e2d4b7f1c35
+Create Date: 2026-10-19 15:10:42.276031
+
+"""
+from typing import Sequence, Union
+import sqlmodel
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6f03a8e5d21'
+down_revision: Union[str, None] = '9e2d4b7f1c35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('daily_statistics',
+    sa.Column('day', postgresql.DATE(), nullable=False),
+    sa.Column('signups', sa.Integer(), nullable=False),
+    sa.Column('referredSignups', sa.Integer(), nullable=False),
+    sa.Column('updatedAt', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+    op.create_table('platform_statistics',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('referredSignups', sa.Integer(), nullable=False),
+    sa.Column('daysWithReferrals', sa.Integer(), nullable=False),
+    sa.Column('totalAmountStaked', sa.Numeric(scale=9), nullable=False),
+    sa.Column('totalMatrixPoolGenerated', sa.Numeric(scale=9), nullable=False),
+    sa.Column('totalAmountWithdrawn', sa.Numeric(scale=9), nullable=False),
+    sa.Column('totalAmountSentToGMP', sa.Numeric(scale=9), nullable=False),
+    sa.Column('totalDistributedFromGMP', sa.Numeric(scale=9), nullable=False),
+    sa.Column('updatedAt', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_joined'), 'users', ['joined'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_users_joined'), table_name='users')
+    op.drop_table('platform_statistics')
+    op.drop_table('daily_statistics')
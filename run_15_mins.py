@@ -12,20 +12,23 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 
 import ast
 
-from src.apps.accounts.models import MatrixPool, MatrixPoolUsers, TokenMeter, User, UserReferral, UserStaking, UserWallet
+from src.apps.accounts.enum import UserLoadProfile
+from src.apps.accounts.models import MatrixPool, MatrixPoolUsers, TokenMeter, User, UserReferral, UserStaking, UserWallet, user_load_options
 import yfinance as yf
 
-from src.apps.accounts.services import UserServices
+from src.apps.accounts.services import AdminServices, MatrixPoolServices, UserServices, flush_after_commit_tasks, queue_user_event
 from src.celery_tasks import celery_app
 from src.db import engine
 from src.db.engine import get_session, get_session_context
 from src.db.redis import redis_client
 from src.db.redis import get_sui_usd_price
-from src.utils.calculations import get_rank, matrix_share
+from src.utils.calculations import get_rank, get_ranks
 from src.utils.logger import LOGGER
 from sqlmodel import select
 
+admin_services = AdminServices()
 user_services = UserServices()
+matrix_pool_services = MatrixPoolServices()
 
 
 
@@ -33,50 +36,47 @@ async def run_cncurrent_tasks():
     await fetch_sui_price()
     await add_fast_bonus()
     await fetch_sui_balance()
+    await rollover_matrix_pools()
     await calculate_users_matrix_pool_share()
     await check_ranking()
+    await refresh_statistics()
+    await flush_after_commit_tasks()
+
+
+async def refresh_statistics():
+    async with get_session_context() as session:
+        session: AsyncSession = session
+        try:
+            await admin_services.refreshStatistics(session)
+            await session.close()
+        except Exception as e:
+            LOGGER.error(e)
+            await session.close()
+
+
+async def rollover_matrix_pools():
+    async with get_session_context() as session:
+        session: AsyncSession = session
+        try:
+            await matrix_pool_services.rollover_pools(session)
+            await session.close()
+        except Exception as e:
+            LOGGER.error(e)
+            await session.close()
 
 
 async def calculate_users_matrix_pool_share():
     async with get_session_context() as session:
         session: AsyncSession = session
         try:
-            now = datetime.now()
             # ###### CALCULATE USERS SHARE TO AN ACTIVE POOL
-            matrix_db = await session.exec(select(MatrixPool).where(MatrixPool.endDate >= now))
-            active_matrix_pool_or_new = matrix_db.first()
+            # payouts are only credited by the rollover once the pool has ended
+            active_matrix_pool_or_new = await matrix_pool_services.get_active_pool(session, create=False)
 
             if active_matrix_pool_or_new:
-                payoutTime = active_matrix_pool_or_new.endDate - timedelta(minutes=4)
-                mp_users_db = await session.exec(select(MatrixPoolUsers).where(MatrixPoolUsers.matrixPoolUid == active_matrix_pool_or_new.uid).order_by(MatrixPoolUsers.referralsAdded))
-                mp_users = mp_users_db.all()
-
-                position = len(mp_users) + 1
-                for mp_user in mp_users:
-                    position -= 1
-                    mp_user.position = position
-
-                    mpu_db = await session.exec(select(User).where(User.userId == mp_user.userId))
-                    mpu: Optional[User] = mpu_db.first()
-                    name = mp_user.userId
-                    if mpu.firstName:
-                        name = mpu.firstName
-                    elif mpu.lastName:
-                        name = mpu.lastName
-
-                    if mp_user.name is None:
-                        mp_user.name = name
-
-                    percentage, earning = await matrix_share(mp_user)
-                    # mp_user.matrixShare = percentage
-                    mp_user.matrixEarninig = earning
-                    if now >= payoutTime:
-                        mpu.wallet.earnings += earning
-                        mpu.wallet.availableReferralEarning += earning
-                        mpu.wallet.totalReferralEarnings += earning
-
-                    await session.commit()
-                    await session.refresh(mp_user)
+                await matrix_pool_services.update_pool_standings(active_matrix_pool_or_new, session)
+                await session.commit()
+                await matrix_pool_services.sync_pool_board(active_matrix_pool_or_new.uid, session)
             await session.close()
         except Exception as e:
             LOGGER.error(e)
@@ -90,53 +90,12 @@ async def fetch_sui_price():
     except Exception as e:
         LOGGER.error(e)
 
-def find_original_deposit(deposit: Decimal):
-    percentage = Decimal(0.1)
-    number = deposit / (1 - percentage)
-    return number
-
 async def add_fast_bonus():
     async with get_session_context() as session:
         session: AsyncSession = session
         try:
-            user_db = await session.exec(select(User).where(User.isBlocked == False).where(User.isAdmin == False).where(User.hasMadeFirstDeposit == False))
-            users = user_db.all()
-
-            for user in users:
-                
-                if user.staking:
-                    deducted_token_purchase_amount = find_original_deposit(user.staking.deposit)
-                    fast_bonus_deadline = user.joined + timedelta(hours=24)
-                    has_minimum_deposit = deducted_token_purchase_amount >= Decimal(1)
-                    now = datetime.now()
-
-                    if now > fast_bonus_deadline or not has_minimum_deposit:
-                        continue
-
-                    ref_db = await session.exec(select(UserReferral).where(UserReferral.userId == user.userId).where(UserReferral.level == 1))
-                    refs = ref_db.all()
-
-                    if len(refs) < 2:
-                        continue
-
-                    active_referrals = []
-                    for u in refs:
-                        ref_db = await session.exec(select(User).where(User.userId == u.theirUserId))
-                        referral = ref_db.first()
-                        if referral:
-                            if find_original_deposit(referral.staking.deposit) >= Decimal(1):
-                                active_referrals.append(u)
-
-                    if len(active_referrals) < 2:
-                        continue
-
-                    user.wallet.totalFastBonus += Decimal(1.00)
-                    user.staking.deposit += Decimal(1.00)
-                    user.hasMadeFirstDeposit = True
-
-                    await session.commit()
-                    await session.refresh(user)
-
+            credited = await user_services.apply_fast_bonuses(session)
+            LOGGER.info(f"Fast bonus credited to {credited} users")
             await session.close()
         except Exception as e:
             LOGGER.error(e)
@@ -147,7 +106,7 @@ async def fetch_sui_balance():
         session: AsyncSession = session
         try:
             now = datetime.now()
-            user_db = await session.exec(select(User).where(User.isBlocked == False).where(User.isAdmin == False))
+            user_db = await session.exec(select(User).where(User.isBlocked == False).where(User.isAdmin == False).options(*user_load_options(UserLoadProfile.STAKING)))
             users = user_db.all()
 
             for user in users:
@@ -164,16 +123,25 @@ async def check_ranking():
         session: AsyncSession = session
         now = datetime.now()
 
-        user_db = await session.exec(select(User).where(User.isBlocked == False).where(User.isAdmin == False))
+        user_db = await session.exec(select(User).where(User.isBlocked == False).where(User.isAdmin == False).options(*user_load_options(UserLoadProfile.STAKING)))
         users = user_db.all()
 
         usd__price = await get_sui_usd_price()
 
-        for user in users:
+        users = [user for user in users if user.wallet and user.staking]
+        ranks = get_ranks(
+            [user.totalTeamVolume for user in users],
+            [user.staking.deposit for user in users],
+            [user.totalReferrals for user in users],
+            usd__price,
+        )
+
+        for user, (rankErning, rank) in zip(users, ranks):
             if user.wallet:
                 LOGGER.info(f"Calling User Rank: {user.firstName}")
-                rankErning, rank = get_rank(user.totalTeamVolume, user.staking.deposit, user.totalReferrals, usd__price)
 
+                previous_rank = user.rank
+                credited = False
                 if not user.rank and rank:
                     if user.joined.date() == user.lastRankEarningAddedAt.date():
                         user.lastRankEarningAddedAt = now + timedelta(days=7)
@@ -188,9 +156,17 @@ async def check_ranking():
                         user.wallet.earnings += user.wallet.weeklyRankEarnings
                         user.wallet.totalRankBonus += user.wallet.weeklyRankEarnings
                         user.wallet.expectedRankBonus += user.wallet.weeklyRankEarnings
+                        credited = True
 
                     user.lastRankEarningAddedAt = now + timedelta(days=7)
 
+                if credited or rank != previous_rank:
+                    queue_user_event(session, user.userId, "rank", {
+                        "rank": rank,
+                        "weeklyRankEarnings": user.wallet.weeklyRankEarnings,
+                        "earnings": user.wallet.earnings,
+                    })
+
                 await session.commit()
                 await session.refresh(user)
                 LOGGER.info(f"Ending User Rank call: {user.firstName} ----------------------------")
@@ -12,13 +12,16 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 
 import ast
 
-from src.apps.accounts.models import MatrixPool, MatrixPoolUsers, TokenMeter, User, UserReferral, UserStaking, UserWallet
+from src.apps.accounts.enum import UserLoadProfile
+from src.apps.accounts.models import MatrixPool, MatrixPoolUsers, TokenMeter, User, UserReferral, UserStaking, UserWallet, user_load_options
 import yfinance as yf
 
-from src.apps.accounts.services import UserServices
+from src.apps.accounts.services import UserServices, flush_after_commit_tasks
 from src.celery_tasks import celery_app
 from src.db import engine
+from src.config.settings import Config
 from src.db.engine import get_session, get_session_context
+from src.db.partitions import detach_activity_partitions, ensure_activity_partitions, month_start
 from src.db.redis import redis_client
 from src.utils.calculations import get_rank, matrix_share
 from src.utils.logger import LOGGER
@@ -29,13 +32,30 @@ user_services = UserServices()
 async def run_cncurrent_tasks():
     # await create_matrix_pool()
     await calculate_daily_tasks()
+    await maintain_activity_partitions()
+    await flush_after_commit_tasks()
+
+async def maintain_activity_partitions():
+    """Keep the coming months of activity partitions ready and detach the ones past retention."""
+    async with get_session_context() as session:
+        try:
+            await ensure_activity_partitions(session)
+            if Config.ACTIVITY_RETENTION_MONTHS:
+                before = month_start(datetime.utcnow().date(), -Config.ACTIVITY_RETENTION_MONTHS)
+                detached = await detach_activity_partitions(before, session)
+                if detached:
+                    LOGGER.info(f"Detached activity partitions: {detached}")
+            await session.commit()
+        except Exception as e:
+            LOGGER.error(e)
+            await session.rollback()
 
 async def calculate_daily_tasks():
     async with get_session_context() as session:
         session: AsyncSession = session
         try:
             now = datetime.now()
-            user_db = await session.exec(select(User).where(User.isBlocked == False).where(User.isAdmin == False))
+            user_db = await session.exec(select(User).where(User.isBlocked == False).where(User.isAdmin == False).options(*user_load_options(UserLoadProfile.STAKING)))
             users: List[User] = user_db.all()
 
             for user in users:
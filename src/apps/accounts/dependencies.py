@@ -1,14 +1,19 @@
-from typing import Annotated, Optional
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import time
+from typing import Annotated, FrozenSet, List, Optional, Tuple
 
 from sqlmodel import select
 
-from fastapi import Depends, Request
+from fastapi import Depends, Query, Request
 from fastapi.security import HTTPBearer, OAuth2PasswordBearer, HTTPAuthorizationCredentials
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.apps.accounts.models import User
+from src.apps.accounts.enum import UserLoadProfile, UserSection
+from src.apps.accounts.models import User, user_load_options
+from src.apps.accounts.schemas import UserPrincipal
 from src.db.engine import get_session
-from src.db.redis import token_in_blocklist
+from src.db.redis import get_user_principal, set_user_principal, token_in_blocklist
 from src.utils.hashing import decodeAccessToken
 from src.errors import AccessTokenRequired, InsufficientPermission, InvalidAuthenticationScheme, RefreshTokenRequired, RevokedToken, UnAuthorizedAccess, UserBlocked, UserNotFound
 from src.utils.logger import LOGGER
@@ -18,8 +23,13 @@ from src.config.settings import Config
 # oauth2_bearer_dependency = Annotated[str, Depends(oauth2_bearer)]
 db_dependency = Annotated[AsyncSession, Depends(get_session)]
 
+# principals are cached briefly in process on top of redis, which is invalidated on every user write
+PRINCIPAL_CACHE_TTL = 10
+PRINCIPAL_CACHE_SIZE = 10000
+_principal_cache: "OrderedDict[str, Tuple[float, UserPrincipal]]" = OrderedDict()
 
-class TokenBearer(HTTPBearer):
+
+class TokenBearer(HTTPBearer, ABC):
     def __init__(self, auto_error=True):
         super().__init__(auto_error=auto_error)
 
@@ -36,19 +46,24 @@ class TokenBearer(HTTPBearer):
         if blocked:
             raise RevokedToken()
 
+        self.verify_token_data(token_data)
         return token_data
 
+    @abstractmethod
+    def verify_token_data(self, token_data: dict) -> None:
+        """Reject tokens of the wrong type for this bearer."""
+
 
 class AccessTokenBearer(TokenBearer):
     def verify_token_data(self, token_data: dict) -> None:
-        if token_data and token_data["refresh"]:
+        if token_data and token_data.get("refresh"):
             raise AccessTokenRequired()
         return None
 
 
 class RefreshTokenBearer(TokenBearer):
     def verify_token_data(self, token_data: dict) -> None:
-        if token_data and not token_data["refresh"]:
+        if token_data and not token_data.get("refresh"):
             raise RefreshTokenRequired()
         return None
 
@@ -58,7 +73,7 @@ async def get_current_user(token_data: Annotated[dict, Depends(AccessTokenBearer
     if userId is None:
         raise UnAuthorizedAccess()
 
-    db_result = await session.exec(select(User).where(User.userId == str(userId)))
+    db_result = await session.exec(select(User).where(User.userId == str(userId)).options(*user_load_options(UserLoadProfile.DASHBOARD)))
     user = db_result.first()
 
     if user is None:
@@ -70,13 +85,73 @@ async def get_current_user(token_data: Annotated[dict, Depends(AccessTokenBearer
     return user
 
 
+def _cached_principal(userId: str) -> Optional[UserPrincipal]:
+    cached = _principal_cache.get(userId)
+    if cached is None:
+        return None
+    expires, principal = cached
+    if expires < time.monotonic():
+        _principal_cache.pop(userId, None)
+        return None
+    _principal_cache.move_to_end(userId)
+    return principal
+
+
+def _cache_principal(principal: UserPrincipal) -> None:
+    _principal_cache[principal.userId] = (time.monotonic() + PRINCIPAL_CACHE_TTL, principal)
+    _principal_cache.move_to_end(principal.userId)
+    while len(_principal_cache) > PRINCIPAL_CACHE_SIZE:
+        _principal_cache.popitem(last=False)
+
+
+async def get_current_principal(token_data: Annotated[dict, Depends(AccessTokenBearer())], session: db_dependency) -> UserPrincipal:
+    """
+    Authorize the request with a slim principal instead of the full user entity. Use
+    `get_current_user` only on endpoints that actually read or change the user.
+    """
+    userId = token_data["user"]["userId"]
+    if userId is None:
+        raise UnAuthorizedAccess()
+    userId = str(userId)
+
+    principal = _cached_principal(userId)
+    if principal is None:
+        cached, generation = await get_user_principal(userId)
+        if cached is not None:
+            principal = UserPrincipal(**cached)
+        else:
+            db_result = await session.exec(
+                select(User.uid, User.userId, User.isBlocked, User.isAdmin, User.isSuperuser).where(User.userId == userId)
+            )
+            row = db_result.first()
+            if row is None:
+                raise UserNotFound()
+            principal = UserPrincipal(**row._mapping)
+            await set_user_principal(userId, principal.model_dump(mode="json"), generation)
+        _cache_principal(principal)
+
+    if principal.isBlocked:
+        raise UserBlocked()
+
+    return principal
+
+
+def user_sections(
+    include: Annotated[
+        Optional[List[UserSection]],
+        Query(description="Only return these parts of the user document, leave out to get all of them"),
+    ] = None,
+) -> Optional[FrozenSet[UserSection]]:
+    return frozenset(include) if include is not None else None
+
+
 async def user_exists_check(userId: str, session: db_dependency) -> Optional[User]:
-    db_result = await session.exec(select(User).where(User.userId == str(userId)))
+    db_result = await session.exec(select(User).where(User.userId == str(userId)).options(*user_load_options(UserLoadProfile.DASHBOARD)))
     user = db_result.first()
     return user
 
 
-async def admin_permission_check(auth_user: Annotated[User, Depends(get_current_user)]) -> User:
+async def admin_permission_check(auth_user: Annotated[UserPrincipal, Depends(get_current_principal)]) -> UserPrincipal:
     if not auth_user.isAdmin or not auth_user.isSuperuser:
         raise InsufficientPermission()
     if auth_user.isBlocked:
@@ -20,3 +20,23 @@ class ActivityType(str, Enum):
             return cls(enum)
         except ValueError:
             raise ValueError(f"'{enum}' is not a valid ActivityType")
+
+
+class UserLoadProfile(str, Enum):
+    AUTH = "auth"
+    DASHBOARD = "dashboard"
+    STAKING = "staking"
+    ADMIN = "admin"
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+class UserSection(str, Enum):
+    """The optional parts of a user document a client can ask for with `include`."""
+    WALLET = "wallet"
+    STAKING = "staking"
+    REFERRER = "referrer"
+    REFERRALS = "referrals"
@@ -2,14 +2,16 @@ from datetime import date, datetime
 from decimal import Decimal
 from pydantic import AnyHttpUrl, EmailStr, FileUrl, IPvAnyAddress
 from pydantic_extra_types.payment import PaymentCardBrand, PaymentCardNumber
-from sqlmodel import SQLModel, Field, Relationship, Column
+from sqlmodel import SQLModel, Field, Relationship, Column, UniqueConstraint
+from sqlalchemy import Index
+from sqlalchemy.orm import joinedload, noload, raiseload, selectinload
 import sqlalchemy.dialects.postgresql as pg
 import uuid
-from typing import List, Optional
+from typing import FrozenSet, List, Optional
 from pydantic_extra_types.phone_numbers import PhoneNumber
 from pydantic_extra_types.country import CountryInfo
 
-from src.apps.accounts.enum import ActivityType
+from src.apps.accounts.enum import ActivityType, UserLoadProfile, UserSection
 
 
 class CeleryBeat(SQLModel, table=True):
@@ -89,7 +91,7 @@ class User(SQLModel, table=True):
     # Activities
     activities: List["Activities"] = Relationship(
         back_populates="user",
-        sa_relationship_kwargs={"cascade": "all, delete-orphan", "lazy": "selectin"}
+        sa_relationship_kwargs={"cascade": "all, delete-orphan", "lazy": "raise_on_sql"}
     )
 
     # Wallet
@@ -107,10 +109,10 @@ class User(SQLModel, table=True):
     # failed transactions
     pendingTransactions: List["PendingTransactions"] = Relationship(
         back_populates="user",
-        sa_relationship_kwargs={"cascade": "all, delete-orphan", "lazy": "selectin"}
+        sa_relationship_kwargs={"cascade": "all, delete-orphan", "lazy": "raise_on_sql"}
     )
 
-    joined: datetime = Field(default_factory=datetime.utcnow, nullable=False, description="Record creation timestamp")
+    joined: datetime = Field(default_factory=datetime.utcnow, nullable=False, index=True, description="Record creation timestamp")
     lastRankEarningAddedAt: datetime = Field(default_factory=datetime.utcnow,
                                              nullable=False, description="Last earning calculation timestamp")
     updatedAt: datetime = Field(default_factory=datetime.utcnow, sa_column=Column(
@@ -273,6 +275,10 @@ class MatrixPool(SQLModel, table=True):
         default_factory=datetime.utcnow,
         sa_column=Column(pg.TIMESTAMP, default=datetime.utcnow),
     )
+    closedAt: Optional[datetime] = Field(
+        sa_column=Column(pg.TIMESTAMP, default=None, nullable=True),
+        description="Set by the rollover once the final standings have been frozen",
+    )
 
     def __repr__(self) -> str:
         return f"<MatrixPool {self.matrixAddress}>"
@@ -307,6 +313,69 @@ class MatrixPoolUsers(SQLModel, table=True):
         return f"<MatrixPoolUser {self.matrixPool} - {self.endDate}>"
 
 
+class MatrixPoolPayout(SQLModel, table=True):
+    """
+    Ledger of matrix pool payouts. A member is paid at most once per pool, which is
+    enforced by the unique (matrixPoolUid, userUid) constraint, and `appliedAt` marks
+    the rows already credited to the member's wallet.
+    """
+    __tablename__ = "matrix_pool_payouts"
+    __table_args__ = (UniqueConstraint("matrixPoolUid", "userUid", name="uq_matrix_pool_payouts_pool_user"),)
+
+    uid: uuid.UUID = Field(
+        sa_column=Column(
+            pg.UUID, primary_key=True, unique=True, nullable=False, default=uuid.uuid4
+        )
+    )
+
+    matrixPoolUid: uuid.UUID = Field(foreign_key="matrix_pool.uid", nullable=False, index=True)
+    userUid: uuid.UUID = Field(foreign_key="users.uid", nullable=False)
+    userId: str
+
+    amount: Decimal = Field(decimal_places=9, default=Decimal(0))
+    matrixShare: Decimal = Field(decimal_places=2, default=Decimal(0))
+
+    created: datetime = Field(
+        default_factory=datetime.utcnow,
+        sa_column=Column(pg.TIMESTAMP, default=datetime.utcnow),
+    )
+    appliedAt: Optional[datetime] = Field(
+        sa_column=Column(pg.TIMESTAMP, default=None, nullable=True),
+    )
+
+    def __repr__(self) -> str:
+        return f"<MatrixPoolPayout {self.matrixPoolUid} - {self.userId}>"
+
+
+class MatrixPoolSnapshot(SQLModel, table=True):
+    """
+    Final standings of a closed matrix pool, frozen by the weekly rollover so pool
+    history can be read without touching the live matrix_users rows.
+    """
+    __tablename__ = "matrix_pool_snapshots"
+    __table_args__ = (UniqueConstraint("matrixPoolUid", "userId", name="uq_matrix_pool_snapshots_pool_user"),)
+
+    uid: uuid.UUID = Field(
+        sa_column=Column(
+            pg.UUID, primary_key=True, unique=True, nullable=False, default=uuid.uuid4
+        )
+    )
+
+    matrixPoolUid: uuid.UUID = Field(foreign_key="matrix_pool.uid", nullable=False, index=True)
+    userId: str = Field(index=True)
+    name: Optional[str] = Field(nullable=True, default=None)
+    position: Optional[int] = Field(nullable=True, default=None)
+    referralsAdded: int = Field(default=0)
+    matrixShare: Decimal = Field(decimal_places=2, default=Decimal(0))
+    matrixEarninig: Decimal = Field(decimal_places=9, default=Decimal(0))
+
+    startDate: datetime = Field(sa_column=Column(pg.TIMESTAMP, nullable=False))
+    endDate: datetime = Field(sa_column=Column(pg.TIMESTAMP, nullable=False))
+
+    def __repr__(self) -> str:
+        return f"<MatrixPoolSnapshot {self.matrixPoolUid} - {self.userId}>"
+
+
 class TokenMeter(SQLModel, table=True):
     __tablename__ = "token_meter"
 
@@ -332,12 +401,48 @@ class TokenMeter(SQLModel, table=True):
         return f"<TokenMeter {self.tokenAddress}>"
 
 
+class DailyStatistics(SQLModel, table=True):
+    """Signups per day, upserted by the statistics job for the days that can still change"""
+    __tablename__ = "daily_statistics"
+
+    day: date = Field(sa_column=Column(pg.DATE, primary_key=True, nullable=False))
+    signups: int = Field(default=0)
+    referredSignups: int = Field(default=0)
+    updatedAt: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<DailyStatistics {self.day}>"
+
+
+class PlatformStatistics(SQLModel, table=True):
+    """Single row rollup of the admin statistics so reading them is one primary key lookup"""
+    __tablename__ = "platform_statistics"
+
+    id: int = Field(default=1, primary_key=True)
+    referredSignups: int = Field(default=0)
+    daysWithReferrals: int = Field(default=0)
+    totalAmountStaked: Decimal = Field(decimal_places=9, default=Decimal(0))
+    totalMatrixPoolGenerated: Decimal = Field(decimal_places=9, default=Decimal(0))
+    totalAmountWithdrawn: Decimal = Field(decimal_places=9, default=Decimal(0))
+    totalAmountSentToGMP: Decimal = Field(decimal_places=9, default=Decimal(0))
+    totalDistributedFromGMP: Decimal = Field(decimal_places=9, default=Decimal(0))
+    updatedAt: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<PlatformStatistics {self.updatedAt}>"
+
+
 class Activities(SQLModel, table=True):
+    """
+    Range partitioned by the month of `created`, which is why it is part of the primary key.
+    Partitions are created ahead of time by `src.db.partitions` and old months can be detached.
+    """
     __tablename__ = "activities"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created)"}
 
     uid: uuid.UUID = Field(
         sa_column=Column(
-            pg.UUID, primary_key=True, unique=True, nullable=False, default=uuid.uuid4
+            pg.UUID, primary_key=True, nullable=False, default=uuid.uuid4
         )
     )
 
@@ -353,5 +458,51 @@ class Activities(SQLModel, table=True):
 
     created: datetime = Field(
         default_factory=datetime.utcnow,
-        sa_column=Column(pg.TIMESTAMP, default=datetime.utcnow),
+        sa_column=Column(pg.TIMESTAMP, primary_key=True, nullable=False, default=datetime.utcnow),
     )
+
+
+# the per user feed and the admin feeds filter on one column and read newest first
+Index("ix_activities_userUid_created", Activities.userUid, Activities.created.desc())
+Index("ix_activities_activityType_created", Activities.activityType, Activities.created.desc())
+
+
+USER_RELATIONSHIPS = ("referrer", "activities", "wallet", "staking", "pendingTransactions")
+
+USER_LOAD_PROFILES = {
+    UserLoadProfile.AUTH: (),
+    UserLoadProfile.DASHBOARD: ("referrer", "wallet", "staking"),
+    UserLoadProfile.STAKING: ("wallet", "staking"),
+    UserLoadProfile.ADMIN: USER_RELATIONSHIPS,
+}
+
+
+def user_load_options(profile: UserLoadProfile) -> list:
+    """
+    Query options for a `select(User)` that load only the relationships the profile touches,
+    the rest are left unloaded and raise instead of emitting sql if they are accessed
+    """
+    loaded = USER_LOAD_PROFILES[profile]
+    return [
+        selectinload(getattr(User, name)) if name in loaded else raiseload(getattr(User, name), sql_only=True)
+        for name in USER_RELATIONSHIPS
+    ]
+
+
+USER_SECTION_RELATIONSHIPS = {
+    UserSection.WALLET: "wallet",
+    UserSection.STAKING: "staking",
+    UserSection.REFERRER: "referrer",
+}
+
+
+def user_section_options(sections: FrozenSet[UserSection]) -> list:
+    """
+    Query options for a sparse user document, the requested one-to-one relationships are joined
+    into the user query and the others read as None without touching the database
+    """
+    options = [
+        joinedload(getattr(User, name)) if section in sections else noload(getattr(User, name))
+        for section, name in USER_SECTION_RELATIONSHIPS.items()
+    ]
+    return options + [raiseload(User.activities, sql_only=True), raiseload(User.pendingTransactions, sql_only=True)]
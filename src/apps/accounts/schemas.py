@@ -8,13 +8,13 @@ from pydantic_extra_types.payment import PaymentCardBrand, PaymentCardNumber
 from pydantic_extra_types.country import CountryInfo
 
 from datetime import date, datetime
-from typing import Optional, List, Annotated
+from typing import FrozenSet, Optional, List, Annotated
 
-from sqlmodel import select
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.apps.accounts.enum import ActivityType
+from src.apps.accounts.enum import ActivityType, UserSection
 from src.apps.accounts.models import MatrixPool, MatrixPoolUsers, User
-from src.db.engine import get_session_context
 
 
 class Message(BaseModel):
@@ -42,6 +42,7 @@ class SignedTTransactionBytesMessage(BaseModel):
 class AccessToken(BaseModel):
     message: str
     access_token: str
+    refresh_token: Optional[str] = None
     user: Optional["UserRead"] = None
 
 
@@ -223,6 +224,15 @@ class UserRead(UserBaseSchema):
         from_attributes = True  # Allows loading from ORM models like SQLModel
 
 
+class UserPrincipal(BaseModel):
+    """The few user fields needed to authorize a request, without loading the user entity."""
+    uid: uuid.UUID
+    userId: str
+    isBlocked: bool = False
+    isAdmin: bool = False
+    isSuperuser: bool = False
+
+
 class UserReferralRead(BaseModel):
     uid: uuid.UUID
     level: int
@@ -276,6 +286,27 @@ class UserWithReferralsRead(BaseModel):
     referralsLv5: List[UserReferralRead]
 
 
+def user_sections_exclude(sections: Optional[FrozenSet[UserSection]]) -> Optional[dict]:
+    """The `exclude` that trims a UserWithReferralsRead document down to `sections`, None keeps all of it."""
+    if sections is None:
+        return None
+
+    exclude = {}
+    user_exclude = {section.value for section in (UserSection.WALLET, UserSection.STAKING, UserSection.REFERRER) if section not in sections}
+    if user_exclude:
+        exclude["user"] = user_exclude
+    if UserSection.REFERRALS not in sections:
+        exclude.update({name: True for name in UserWithReferralsRead.model_fields if name.startswith("referralsLv")})
+    return exclude
+
+
+BULK_USER_LOOKUP_LIMIT = 300
+
+
+class UserBulkLookup(BaseModel):
+    userIds: List[str] = Field(min_length=1, max_length=BULK_USER_LOOKUP_LIMIT)
+
+
 class WalletBaseSchema(BaseModel):
     address: str
     # phrase: str
@@ -402,6 +433,17 @@ class MatrixPoolRead(MatrixPoolBase):
     users: List["MatrixUsersRead"]
     totalReferrals: int = 0
 
+    @classmethod
+    async def from_pool(cls, pool: MatrixPool, session: AsyncSession) -> "MatrixPoolRead":
+        return cls(
+            uid=pool.uid,
+            raisedPoolAmount=pool.raisedPoolAmount,
+            startDate=pool.startDate,
+            endDate=pool.endDate,
+            totalReferrals=pool.totalReferrals,
+            users=await MatrixUsersRead.from_pool_members(pool.uid, session),
+        )
+
 
 class MatrixUserCreateUpdate(BaseModel):
     userId: str
@@ -418,41 +460,60 @@ class MatrixUsersRead(BaseModel):
     matrixShare: Decimal
     position: Optional[int]
 
-    @staticmethod
-    async def calc_position(matrixPoolUser: "MatrixUsersRead"):
-        mpu_position = 1
-        async with get_session_context() as session:
-            p_db = await session.exec(select(MatrixPoolUsers).where(MatrixPoolUsers.matrixPoolUid == matrixPoolUser.matrixPoolUid).order_by(MatrixPoolUsers.referralsAdded))
-            positions = p_db.all()
-
-            for p in positions:
-                if p.userId != matrixPoolUser.userId:
-                    mpu_position += 1
-                elif p.userid == matrixPoolUser.userId:
-                    return mpu_position
+    @classmethod
+    async def from_pool_members(cls, matrixPoolUid: uuid.UUID, session: AsyncSession) -> List["MatrixUsersRead"]:
+        """Resolve the position and display name of every member of a pool in one query."""
+        member_name = (
+            select(func.coalesce(User.firstName, User.lastName))
+            .where(User.userId == MatrixPoolUsers.userId)
+            .limit(1)
+            .scalar_subquery()
+        )
+        p_db = await session.exec(
+            select(
+                MatrixPoolUsers,
+                func.rank().over(order_by=MatrixPoolUsers.referralsAdded.desc()),
+                func.coalesce(member_name, MatrixPoolUsers.userId),
+            )
+            .where(MatrixPoolUsers.matrixPoolUid == matrixPoolUid)
+            .order_by(MatrixPoolUsers.referralsAdded.desc())
+        )
+
+        members = []
+        for member, position, name in p_db.all():
+            member_dict = member.model_dump()
+            member_dict["position"] = position
+            member_dict["name"] = name
+            members.append(cls(**member_dict))
+        return members
 
-    @staticmethod
-    async def return_name(matrixPoolUser: "MatrixUsersRead"):
-        async with get_session_context() as session:
-            mp_db = await session.exec(select(User).where(User.userid == matrixPoolUser.userId))
-            mp = mp_db.first()
 
-            name = matrixPoolUser.userId
+class MatrixPoolStandingRead(BaseModel):
+    matrixPoolUid: uuid.UUID
+    userId: str
+    name: Optional[str] = None
+    referralsAdded: int = 0
+    position: Optional[int] = None
 
-            if mp.firstName:
-                name = mp.firstName
-            elif mp.lastName:
-                name = mp.lastName
 
-            return name
+class MatrixPoolBoardRead(BaseModel):
+    matrixPoolUid: uuid.UUID
+    users: List[MatrixPoolStandingRead]
 
 
-    @classmethod
-    def fro_orm(cls, pool: "MatrixUsersRead"):
-        pool_dict = pool.model_dump()
-        pool_dict["position"] = cls.calc_position(pool)
-        pool_dict["name"] = cls.return_name(pool)
-        return cls(**pool_dict)
+class MatrixPoolSnapshotRead(BaseModel):
+    matrixPoolUid: uuid.UUID
+    userId: str
+    name: Optional[str] = None
+    position: Optional[int] = None
+    referralsAdded: int = 0
+    matrixShare: Decimal = Decimal(0)
+    matrixEarninig: Decimal = Decimal(0)
+    startDate: datetime
+    endDate: datetime
+
+    class Config:
+        from_attributes = True
 
 
 class ActivitiesRead(BaseModel):
@@ -6,7 +6,7 @@ import random
 import uuid
 
 from datetime import date, datetime, timedelta
-from typing import Annotated, Any, List, Optional
+from typing import Annotated, Any, AsyncIterator, FrozenSet, List, NamedTuple, Optional, Tuple
 from uuid import UUID
 
 from fastapi import BackgroundTasks, Depends, File, HTTPException, Request, UploadFile
@@ -16,22 +16,30 @@ from apscheduler.schedulers.background import BackgroundScheduler  # runs tasks
 from apscheduler.triggers.cron import CronTrigger  # allows us to specify a recurring time for execution
 
 import requests
-from sqlalchemy import Date, cast
+from itertools import chain
+
+from sqlalchemy import Date, Numeric, cast, event, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session as OrmSession, noload
+from sqlalchemy.orm.util import identity_key
 from sqlmodel import select, func, literal
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.apps.accounts.dependencies import user_exists_check
-from src.apps.accounts.enum import ActivityType
-from src.apps.accounts.models import Activities, MatrixPool, MatrixPoolUsers, PendingTransactions, TokenMeter, User, UserReferral, UserStaking, UserWallet
-from src.apps.accounts.schemas import AdminLogin, AllStatisticsRead, MatrixUserCreateUpdate, TokenMeterCreate, TokenMeterUpdate, UserCreateOrLoginSchema, UserLoginSchema, UserUpdateSchema, Wallet
+from src.apps.accounts.enum import ActivityType, ExportFormat, UserLoadProfile, UserSection
+from src.apps.accounts.models import Activities, DailyStatistics, MatrixPool, MatrixPoolPayout, MatrixPoolSnapshot, MatrixPoolUsers, PendingTransactions, PlatformStatistics, TokenMeter, User, UserReferral, UserStaking, UserWallet, user_load_options, user_section_options
+from src.apps.accounts.schemas import AdminLogin, AllStatisticsRead, UserWithReferralsRead, MatrixUserCreateUpdate, TokenMeterCreate, TokenMeterUpdate, UserCreateOrLoginSchema, UserLoginSchema, UserUpdateSchema, Wallet
 from src.celery_beat import TemplateScheduleSQLRepository
 from src.utils.calculations import get_rank
+from src.utils.export import EXPORT_BATCH_SIZE, encode_rows
+from src.utils.local_cache import LocalCache
 from src.utils.sui_json_rpc_apis import SUI
-from src.errors import ActivePoolNotFound, InsufficientBalance, InvalidCredentials, InvalidStakeAmount, InvalidTelegramAuthData, OnlyOneTokenMeterRequired, ReferrerNotFound, StakingExpired, TokenMeterDoesNotExists, TokenMeterExists, UserAlreadyExists, UserBlocked, UserNotFound
-from src.utils.hashing import createAccessToken, verifyHashKey, verifyTelegramAuthData
+from src.errors import ActivePoolNotFound, InsufficientBalance, MatrixPoolNotFound, InvalidCredentials, InvalidToken, RevokedToken, InvalidStakeAmount, InvalidTelegramAuthData, OnlyOneTokenMeterRequired, ReferrerNotFound, StakingExpired, TokenMeterDoesNotExists, TokenMeterExists, UserAlreadyExists, UserBlocked, UserNotFound
+from src.utils.hashing import createAccessToken, verifyHashKeyAsync, verifyTelegramAuthData
 from src.utils.logger import LOGGER
 from src.config.settings import Config
-from src.db.redis import get_sui_usd_price
+from src.db.engine import get_session_context
+from src.db.redis import REFRESH_SESSION_EXPIRY, REFRESH_SESSION_REUSED, REFRESH_SESSION_ROTATED, add_refresh_session, invalidate_user_reads, publish_events, revoke_refresh_sessions, rotate_refresh_session, get_active_matrix_pool_uid, get_matrix_pool_board, get_matrix_pool_position, get_sui_usd_price, incr_matrix_pool_referrals, matrix_pool_board_exists, set_active_matrix_pool, sync_matrix_pool_board
 
 
 from mnemonic import Mnemonic
@@ -43,6 +51,99 @@ from sui_python_sdk.wallet import SuiWallet
 celery_beat = TemplateScheduleSQLRepository()
 
 STAKING_MIN = 1
+# share of every deposit converted into tokens before it reaches the stake
+TOKEN_PURCHASE_PERCENT = Decimal("0.1")
+FAST_BONUS_WINDOW = timedelta(hours=24)
+FAST_BONUS_MIN_REFERRALS = 2
+MATRIX_POOL_DURATION = timedelta(days=7)
+# how long before the active pool ends the rollover opens the next one
+MATRIX_POOL_LEAD_TIME = timedelta(days=1)
+# transaction scoped advisory lock held while pools are opened or closed
+MATRIX_POOL_LOCK_KEY = 7_103_001
+REFERRAL_LEVELS = 5
+REFERRALS_PER_LEVEL = 50
+
+STALE_USER_READS = "stale_user_reads"
+PENDING_USER_EVENTS = "pending_user_events"
+PENDING_ACTIVE_POOL = "pending_active_pool"
+_pending_invalidations = set()
+
+
+class TokenMeterInfo(NamedTuple):
+    """The token meter fields that only change when an admin edits the meter."""
+    uid: uuid.UUID
+    tokenAddress: Optional[str]
+    tokenPrivateKey: Optional[str]
+    tokenPrice: Decimal
+    totalCap: Decimal
+
+
+class ActivePoolInfo(NamedTuple):
+    uid: uuid.UUID
+    startDate: datetime
+    endDate: datetime
+
+
+token_meter_cache: LocalCache[TokenMeterInfo] = LocalCache("token_meter")
+active_pool_cache: LocalCache[ActivePoolInfo] = LocalCache("matrix_pool:active")
+
+
+def queue_user_event(session: AsyncSession, userId: Optional[str], event: str, data: dict) -> None:
+    """Publish a delta to a user's event stream (or every stream when userId is None) once the session commits."""
+    session.info.setdefault(PENDING_USER_EVENTS, []).append((userId, event, data))
+
+
+@event.listens_for(OrmSession, "after_flush")
+def collect_stale_user_reads(session, flush_context):
+    """Remember which users' cached /users/me documents a flush has made stale."""
+    stale = session.info.setdefault(STALE_USER_READS, set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, User):
+            stale.add(obj.userId)
+        elif isinstance(obj, UserReferral) and obj.userId:
+            stale.add(obj.userId)
+        elif isinstance(obj, (UserWallet, UserStaking)) and obj.userUid:
+            owner = session.identity_map.get(identity_key(User, obj.userUid))
+            if owner is not None:
+                stale.add(owner.userId)
+
+
+def _run_after_commit(coro) -> None:
+    try:
+        task = asyncio.get_running_loop().create_task(coro)
+    except RuntimeError:
+        coro.close()
+        return
+    _pending_invalidations.add(task)
+    task.add_done_callback(_pending_invalidations.discard)
+
+
+async def flush_after_commit_tasks() -> None:
+    """Wait for pending cache invalidations and event publishes, for scripts that exit right after committing."""
+    if _pending_invalidations:
+        await asyncio.gather(*list(_pending_invalidations), return_exceptions=True)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def drop_stale_user_reads(session):
+    stale = session.info.pop(STALE_USER_READS, None)
+    if stale:
+        _run_after_commit(invalidate_user_reads(*stale))
+
+    events = session.info.pop(PENDING_USER_EVENTS, None)
+    if events:
+        _run_after_commit(publish_events(events))
+
+    active_pool = session.info.pop(PENDING_ACTIVE_POOL, None)
+    if active_pool:
+        _run_after_commit(set_active_matrix_pool(*active_pool))
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def forget_stale_user_reads(session):
+    session.info.pop(STALE_USER_READS, None)
+    session.info.pop(PENDING_USER_EVENTS, None)
+    session.info.pop(PENDING_ACTIVE_POOL, None)
 
 
 class AdminServices:
@@ -62,6 +163,7 @@ class AdminServices:
         tokenMeter = TokenMeter(**form_dict)
         session.add(tokenMeter)
         await session.commit()
+        await token_meter_cache.drop()
         return tokenMeter
 
     async def updateTokenRecord(self, form_data: TokenMeterUpdate, session: AsyncSession):
@@ -79,13 +181,12 @@ class AdminServices:
 
         session.add(existingTokenMeter)
         await session.commit()
+        await token_meter_cache.drop()
         await session.refresh(existingTokenMeter)
         return existingTokenMeter
 
     async def addNewPoolUser(self, poolUser: MatrixUserCreateUpdate, session: AsyncSession):
-        now = datetime.now()
-        db_pool_result = await session.exec(select(MatrixPool).where(MatrixPool.endDate > now))
-        active_pool = db_pool_result.first()
+        active_pool = await matrix_pool_services.get_active_pool(session, create=False)
         if active_pool is None:
             raise ActivePoolNotFound()
 
@@ -105,40 +206,77 @@ class AdminServices:
         await session.refresh(pool_user)
         return pool_user
 
-    async def statRecord(self, session: AsyncSession) -> AllStatisticsRead:
-        # Step 1: Group referred users by date, counting referrals per day
-        daily_referrals_query = (
+    async def refreshStatistics(self, session: AsyncSession) -> None:
+        """
+        Recount signups from the last rolled up day onwards, then recompute the platform totals
+        into the single row statRecord reads
+        """
+        now = datetime.utcnow()
+        last_day = (await session.exec(select(func.max(DailyStatistics.day)))).one()
+
+        join_day = cast(User.joined, Date)
+        daily = (
             select(
-                cast(User.joined, Date).label("join_date"),
-                func.count(User.userId).label("daily_referrals")
+                join_day.label("day"),
+                func.count(User.uid).label("signups"),
+                func.count(User.referrer_id).label("referredSignups"),
+                literal(now).label("updatedAt"),
             )
-            .where(User.referredByUserId != None)
-            .group_by(cast(User.joined, Date))
+            .group_by(join_day)
         )
+        if last_day is not None:
+            daily = daily.where(User.joined >= last_day)
+        daily_upsert = pg_insert(DailyStatistics).from_select(["day", "signups", "referredSignups", "updatedAt"], daily)
+        await session.exec(daily_upsert.on_conflict_do_update(
+            index_elements=[DailyStatistics.day],
+            set_={
+                "signups": daily_upsert.excluded.signups,
+                "referredSignups": daily_upsert.excluded.referredSignups,
+                "updatedAt": daily_upsert.excluded.updatedAt,
+            },
+        ))
 
-        # Execute the query to get daily referral counts
-        daily_referrals = await session.exec(daily_referrals_query)
-        daily_referrals = daily_referrals.all()
-
-        # Step 2: Calculate the total referrals and the average referrals per day
-        total_days_with_referrals = len(daily_referrals)
-        total_referred_users = sum(row.daily_referrals for row in daily_referrals)
-        average_daily_referrals = int(total_referred_users / total_days_with_referrals) if total_days_with_referrals else 0
-
-        # Query the total amount staked by summing deposits from the userStaking model
-        total_staked_query = select(func.sum(UserWallet.totalDeposit))
-        total_staked_result = await session.exec(total_staked_query)
-        total_staked = total_staked_result.scalar() or Decimal(0.00)
+        referred_signups, days_with_referrals = (await session.exec(
+            select(
+                func.coalesce(func.sum(DailyStatistics.referredSignups), 0),
+                func.count().filter(DailyStatistics.referredSignups > 0),
+            )
+        )).one()
+        total_staked = (await session.exec(select(func.coalesce(func.sum(UserWallet.totalDeposit), 0)))).one()
+        total_pool_generated = (await session.exec(select(func.coalesce(func.sum(MatrixPool.raisedPoolAmount), 0)))).one()
+        token_meter = (await session.exec(select(TokenMeter))).first()
+
+        totals = {
+            "id": 1,
+            "referredSignups": referred_signups,
+            "daysWithReferrals": days_with_referrals,
+            "totalAmountStaked": total_staked,
+            "totalMatrixPoolGenerated": total_pool_generated,
+            "totalAmountWithdrawn": token_meter.totalWithdrawn if token_meter else Decimal(0),
+            "totalAmountSentToGMP": token_meter.totalSentToGMP if token_meter else Decimal(0),
+            "totalDistributedFromGMP": token_meter.totalDistributedByGMP if token_meter else Decimal(0),
+            "updatedAt": now,
+        }
+        totals_upsert = pg_insert(PlatformStatistics).values(**totals)
+        await session.exec(totals_upsert.on_conflict_do_update(
+            index_elements=[PlatformStatistics.id],
+            set_={key: totals_upsert.excluded[key] for key in totals if key != "id"},
+        ))
+        await session.commit()
 
-        # Query to get the total amount raised in the metrix pool
-        total_pool_query = select(func.sum(MatrixPool.raisedPoolAmount))
-        total_pool_result = await session.exec(total_pool_query)
-        total_pool_generated = total_pool_result.scalar() or Decimal(0.00)
+    async def statRecord(self, session: AsyncSession) -> AllStatisticsRead:
+        stats = await session.get(PlatformStatistics, 1)
+        if stats is None:
+            await self.refreshStatistics(session)
+            stats = await session.get(PlatformStatistics, 1)
 
         return AllStatisticsRead(
-            averageDailyReferral=average_daily_referrals,
-            totalAmountStaked=total_staked,
-            totalMatrixPoolGenerated=total_pool_generated,
+            averageDailyReferral=int(stats.referredSignups / stats.daysWithReferrals) if stats.daysWithReferrals else 0,
+            totalAmountStaked=stats.totalAmountStaked,
+            totalMatrixPoolGenerated=stats.totalMatrixPoolGenerated,
+            totalAmountWithdrawn=stats.totalAmountWithdrawn,
+            totalAmountSentToGMP=stats.totalAmountSentToGMP,
+            totalDistributedFromGMP=stats.totalDistributedFromGMP,
         )
 
     async def getAllTransactions(self, date: date, session: AsyncSession):
@@ -158,19 +296,62 @@ class AdminServices:
 
     async def getAllUsers(self, date: date, session: AsyncSession):
         if date is not None:
-            users = await session.exec(select(User).where(User.isSuperuser == False).where(User.joined.date() >= date).order_by(User.joined.desc(), User.firstName.desc()))
+            users = await session.exec(select(User).where(User.isSuperuser == False).where(User.joined.date() >= date).order_by(User.joined.desc(), User.firstName.desc()).options(*user_load_options(UserLoadProfile.DASHBOARD)))
             return users.all()
-        users = await session.exec(select(User).where(User.isSuperuser == False).order_by(User.joined.desc(), User.firstName.desc()))
+        users = await session.exec(select(User).where(User.isSuperuser == False).order_by(User.joined.desc(), User.firstName.desc()).options(*user_load_options(UserLoadProfile.DASHBOARD)))
         return users.all()
 
+    async def _stream_export(self, query, fmt: ExportFormat) -> AsyncIterator[bytes]:
+        # the request session is closed before a streaming body is sent, so the export owns its own
+        async with get_session_context() as session:
+            result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for chunk in encode_rows(result.partitions(), list(result.keys()), fmt):
+                yield chunk
+
+    def _within_dates(self, query, column, start: Optional[date], end: Optional[date]):
+        if start is not None:
+            query = query.where(column >= start)
+        if end is not None:
+            query = query.where(column < end + timedelta(days=1))
+        return query
+
+    def exportUsers(self, start: Optional[date], end: Optional[date], fmt: ExportFormat) -> AsyncIterator[bytes]:
+        query = (
+            select(
+                User.uid, User.userId, User.firstName, User.lastName, User.rank, User.isBlocked,
+                User.totalTeamVolume, User.totalReferrals, User.totalNetwork, User.referrer_name, User.joined,
+                UserWallet.address.label("walletAddress"), UserWallet.balance, UserWallet.totalDeposit,
+                UserWallet.earnings, UserWallet.totalWithdrawn,
+                UserStaking.deposit.label("stakeDeposit"), UserStaking.roi.label("stakeRoi"),
+            )
+            .outerjoin(UserWallet, UserWallet.userUid == User.uid)
+            .outerjoin(UserStaking, UserStaking.userUid == User.uid)
+            .where(User.isSuperuser == False)
+            .order_by(User.joined)
+        )
+        return self._stream_export(self._within_dates(query, User.joined, start, end), fmt)
+
+    def exportActivities(self, start: Optional[date], end: Optional[date], fmt: ExportFormat) -> AsyncIterator[bytes]:
+        query = (
+            select(
+                Activities.uid, Activities.activityType, Activities.strDetail, Activities.amountDetail,
+                Activities.suiAmount, Activities.userUid, User.userId, Activities.created,
+            )
+            .join(User, User.uid == Activities.userUid)
+            .order_by(Activities.created)
+        )
+        return self._stream_export(self._within_dates(query, Activities.created, start, end), fmt)
+
     async def banUser(self, userId: str, session: AsyncSession) -> bool:
-        db_result = await session.exec(select(User).where(User.userId == userId))
+        db_result = await session.exec(select(User).where(User.userId == userId).options(*user_load_options(UserLoadProfile.AUTH)))
         user = db_result.first()
         if user is None:
             raise UserNotFound()
 
         user.isBlocked = False if user.isBlocked else True
         await session.commit()
+        if user.isBlocked:
+            await revoke_refresh_sessions(user.userId)
         await session.refresh(user)
         return True
 
@@ -218,6 +399,7 @@ class UserServices:
             select(User)
             .join(cte, User.uid == cte.c.uid)
             .where(cte.c.level == level)
+            .options(*user_load_options(UserLoadProfile.DASHBOARD))
         )
 
         results = await session.exec(query)
@@ -251,7 +433,7 @@ class UserServices:
                 raise Exception('Request could not be completed')
 
             if referring_user.referrer_id is not None:
-                db_result = await session.exec(select(User).where(User.uid == referring_user.referrer_id))
+                db_result = await session.exec(select(User).where(User.uid == referring_user.referrer_id).options(*user_load_options(UserLoadProfile.AUTH)))
                 referrers_referrer = db_result.first()
                 if referrers_referrer:
                     new_level = level + 1
@@ -259,7 +441,7 @@ class UserServices:
         return None
 
     async def create_referrer(self, referrer_userId: Optional[str], new_user: User, session: AsyncSession):
-        db_result = await session.exec(select(User).where(User.userId == referrer_userId))
+        db_result = await session.exec(select(User).where(User.userId == referrer_userId).options(*user_load_options(UserLoadProfile.AUTH)))
         referring_user = db_result.first()
 
         if not referring_user:
@@ -279,44 +461,39 @@ class UserServices:
         return None
 
     async def add_to_matrix_pool(self, referrer_userId: str, session: AsyncSession):
-        now = datetime.now()
-        matrix_db = await session.exec(select(MatrixPool).where(MatrixPool.endDate >= now))
-        active_matrix_pool_or_new = matrix_db.first()
+        active_pool = await matrix_pool_services.get_active_pool_info(session)
 
-        us_db = await session.exec((select(User).where(User.userId == referrer_userId)))
+        us_db = await session.exec(select(User).where(User.userId == referrer_userId).options(*user_load_options(UserLoadProfile.AUTH)))
         user = us_db.first()
 
         name = referrer_userId
         if user is not None:
             name = user.firstName
 
-        if not active_matrix_pool_or_new:
-            active_matrix_pool_or_new = MatrixPool(
-                uid=uuid.uuid4(),
-                totalReferrals=1,
-                startDate=now,
-                endDate=now + timedelta(days=7)
-            )
-            session.add(active_matrix_pool_or_new)
-        else:
-            active_matrix_pool_or_new.totalReferrals += 1
+        await matrix_pool_services.add_to_pool_totals(active_pool.uid, session, totalReferrals=1)
 
-        mp_user_db = await session.exec(select(MatrixPoolUsers).where(MatrixPoolUsers.matrixPoolUid == active_matrix_pool_or_new.uid).where(MatrixPoolUsers.userId == referrer_userId))
+        mp_user_db = await session.exec(select(MatrixPoolUsers).where(MatrixPoolUsers.matrixPoolUid == active_pool.uid).where(MatrixPoolUsers.userId == referrer_userId))
         mp_user = mp_user_db.first()
 
         if mp_user is None:
             new_mp_user = MatrixPoolUsers(
-                matrixPoolUid=active_matrix_pool_or_new.uid,
+                matrixPoolUid=active_pool.uid,
                 userId=referrer_userId,
                 name=name,
                 position=None,
                 referralsAdded=1,
-                matrixShare=1,
             )
             session.add(new_mp_user)
         else:
+            # matrixShare is a percentage derived from referralsAdded by update_pool_standings
             mp_user.referralsAdded += 1
-            mp_user.matrixShare += 1
+
+        # keep the live leaderboard in step, the batch job reconciles it with the database
+        try:
+            board_name = (user.firstName or user.lastName) if user is not None else None
+            await incr_matrix_pool_referrals(active_pool.uid, active_pool.endDate, referrer_userId, board_name)
+        except Exception as e:
+            LOGGER.error(f"Matrix pool leaderboard update failed: {e}")
 
     async def create_wallet(self, user: User, session: AsyncSession):
         # mnemonic_phrase = Mnemonic("english").generate(strength=128)
@@ -341,13 +518,55 @@ class UserServices:
         session.add(new_staking)
         return new_staking
 
+    def _create_tokens(self, userId: str, sessionId: str, refreshJti: str) -> Tuple[str, str]:
+        user_data = {"userId": userId}
+        accessToken = createAccessToken(
+            user_data=user_data,
+            expiry=timedelta(seconds=Config.ACCESS_TOKEN_EXPIRY),
+            sessionId=sessionId,
+        )
+        refreshToken = createAccessToken(
+            user_data=user_data,
+            refresh=True,
+            expiry=timedelta(seconds=REFRESH_SESSION_EXPIRY),
+            sessionId=sessionId,
+            jti=refreshJti,
+        )
+        return accessToken, refreshToken
+
+    async def issue_tokens(self, userId: str) -> Tuple[str, str]:
+        """Start a new refresh session for the user and return its access and refresh tokens."""
+        sessionId = uuid.uuid4().hex
+        refreshJti = str(uuid.uuid4())
+        await add_refresh_session(userId, sessionId, refreshJti)
+        return self._create_tokens(userId, sessionId, refreshJti)
+
+    async def rotate_tokens(self, token_data: dict) -> Tuple[str, str]:
+        """
+        Exchange a refresh token for a new access and refresh token pair in the same session,
+        the presented refresh token stops working
+        """
+        userId = token_data["user"]["userId"]
+        sessionId = token_data.get("sid")
+        if sessionId is None or not token_data.get("refresh"):
+            raise InvalidToken()
+
+        refreshJti = str(uuid.uuid4())
+        rotated = await rotate_refresh_session(userId, sessionId, token_data["jti"], refreshJti)
+        if rotated == REFRESH_SESSION_REUSED:
+            LOGGER.warning(f"Refresh token reused for {userId}, session {sessionId} revoked")
+            raise RevokedToken()
+        if rotated != REFRESH_SESSION_ROTATED:
+            raise RevokedToken()
+        return self._create_tokens(userId, sessionId, refreshJti)
+
     async def authenticate_user(self, form_data: AdminLogin, session):
         user = await user_exists_check(form_data.userId, session)
 
         if user is None:
             raise UserNotFound()
 
-        valid_password = verifyHashKey(form_data.password, user.passwordHash)
+        valid_password = await verifyHashKeyAsync(form_data.password, user.passwordHash)
         if not valid_password:
             raise InvalidCredentials()
 
@@ -356,19 +575,7 @@ class UserServices:
             raise UserBlocked()
 
         # generate access and refresh token so long the telegram init data is valid
-        accessToken = createAccessToken(
-            user_data={
-                "userId": user.userId,
-            },
-            expiry=timedelta(seconds=Config.ACCESS_TOKEN_EXPIRY)
-        )
-        refreshToken = createAccessToken(
-            user_data={
-                "userId": user.userId,
-            },
-            refresh=True,
-            expiry=timedelta(days=7)
-        )
+        accessToken, refreshToken = await self.issue_tokens(user.userId)
 
         return accessToken, refreshToken, user
 
@@ -392,19 +599,7 @@ class UserServices:
         #     await self.calculate_and_update_staked_interest_every_5_days(session, active_stake)
 
         # generate access and refresh token so long the telegram init data is valid
-        accessToken = createAccessToken(
-            user_data={
-                "userId": user.userId,
-            },
-            expiry=timedelta(seconds=Config.ACCESS_TOKEN_EXPIRY)
-        )
-        refreshToken = createAccessToken(
-            user_data={
-                "userId": user.userId,
-            },
-            refresh=True,
-            expiry=timedelta(days=7)
-        )
+        accessToken, refreshToken = await self.issue_tokens(user.userId)
 
         return accessToken, refreshToken, user
 
@@ -439,19 +634,7 @@ class UserServices:
                 if user.isBlocked:
                     raise UserBlocked()
 
-                accessToken = createAccessToken(
-                    user_data={
-                        "userId": user.userId,
-                    },
-                    expiry=timedelta(seconds=Config.ACCESS_TOKEN_EXPIRY)
-                )
-                refreshToken = createAccessToken(
-                    user_data={
-                        "userId": user.userId,
-                    },
-                    refresh=True,
-                    expiry=timedelta(days=7)
-                )
+                accessToken, refreshToken = await self.issue_tokens(user.userId)
 
                 return accessToken, refreshToken, user
 
@@ -482,7 +665,7 @@ class UserServices:
 
             new_wallet = await self.create_wallet(new_user, session)
 
-            db_result = await session.exec(select(User).where(User.userId == str(form_data.userId)))
+            db_result = await session.exec(select(User).where(User.userId == str(form_data.userId)).options(*user_load_options(UserLoadProfile.AUTH)))
             if len(db_result.all()) > 1:
                 await session.delete(new_user)
             else:
@@ -491,19 +674,7 @@ class UserServices:
                 # await session.flush(new_user)
 
                 # generate access and refresh token so long the telegram init data is valid
-                accessToken = createAccessToken(
-                    user_data={
-                        "userId": new_user.userId,
-                    },
-                    expiry=timedelta(seconds=Config.ACCESS_TOKEN_EXPIRY)
-                )
-                refreshToken = createAccessToken(
-                    user_data={
-                        "userId": new_user.userId,
-                    },
-                    refresh=True,
-                    expiry=timedelta(days=7)
-                )
+                accessToken, refreshToken = await self.issue_tokens(new_user.userId)
 
                 return accessToken, refreshToken, new_user
         except Exception as e:
@@ -512,12 +683,86 @@ class UserServices:
             raise e
 
     async def return_user_by_userId(self, userId: int, session: AsyncSession):
-        db_result = await session.exec(select(User).where(User.userId == userId))
+        db_result = await session.exec(select(User).where(User.userId == userId).options(*user_load_options(UserLoadProfile.DASHBOARD)))
+        user = db_result.first()
+        if user is None:
+            raise UserNotFound()
+        return user
+
+    async def get_referral_levels(self, userIds: List[str], session: AsyncSession) -> dict:
+        """
+        Return the first REFERRALS_PER_LEVEL referrals of every level for each user, keyed by userId
+        and then `referralsLv<n>`, read in a single windowed query however many users are asked for
+        """
+        if not userIds:
+            return {}
+
+        ranked = (
+            select(
+                UserReferral.uid,
+                func.row_number().over(
+                    partition_by=(UserReferral.userId, UserReferral.level),
+                    order_by=UserReferral.created,
+                ).label("position"),
+            )
+            .where(UserReferral.userId.in_(userIds))
+            .where(UserReferral.level.between(1, REFERRAL_LEVELS))
+            .subquery()
+        )
+        db_result = await session.exec(
+            select(UserReferral)
+            .join(ranked, ranked.c.uid == UserReferral.uid)
+            .where(ranked.c.position <= REFERRALS_PER_LEVEL)
+            .order_by(UserReferral.userId, UserReferral.level, ranked.c.position)
+        )
+
+        levels = {userId: {f"referralsLv{level}": [] for level in range(1, REFERRAL_LEVELS + 1)} for userId in userIds}
+        for referral in db_result.all():
+            levels[referral.userId][f"referralsLv{referral.level}"].append(referral)
+        return levels
+
+    async def get_user_with_referrals(self, user: User, session: AsyncSession, sections: Optional[FrozenSet[UserSection]] = None) -> dict:
+        """`sections` limits the document to what a sparse request includes, the referrals are only read when asked for."""
+        if sections is not None and UserSection.REFERRALS not in sections:
+            return {
+                "user": user,
+                **{f"referralsLv{level}": [] for level in range(1, REFERRAL_LEVELS + 1)},
+            }
+
+        levels = await self.get_referral_levels([user.userId], session)
+        return {
+            "user": user,
+            **levels[user.userId],
+        }
+
+    async def get_sparse_user(self, userId: str, sections: FrozenSet[UserSection], session: AsyncSession) -> User:
+        """Load a user with only the relationships in `sections`, in a single query."""
+        db_result = await session.exec(select(User).where(User.userId == userId).options(*user_section_options(sections)))
         user = db_result.first()
+
         if user is None:
             raise UserNotFound()
         return user
 
+    async def get_users_with_referrals(self, userIds: List[str], session: AsyncSession) -> List[dict]:
+        """The `get_user_with_referrals` payload of many users in request order, unknown userIds are skipped."""
+        userIds = list(dict.fromkeys(userIds))
+        db_result = await session.exec(
+            select(User).where(User.userId.in_(userIds)).options(*user_load_options(UserLoadProfile.DASHBOARD))
+        )
+        users = {user.userId: user for user in db_result.all()}
+        levels = await self.get_referral_levels(list(users), session)
+        return [
+            {"user": users[userId], **levels[userId]}
+            for userId in userIds
+            if userId in users
+        ]
+
+    async def serialise_user_with_referrals(self, user: User, session: AsyncSession) -> bytes:
+        """Build the /users/me document once, validated and encoded, ready to be cached."""
+        userResp = await self.get_user_with_referrals(user, session)
+        return UserWithReferralsRead.model_validate(userResp, from_attributes=True).model_dump_json().encode("utf-8")
+
     async def updateUserProfile(self, user: User, form_data: UserUpdateSchema, session: AsyncSession):
         form_dict = form_data.model_dump()
 
@@ -554,19 +799,38 @@ class UserServices:
         referrer.totalTeamVolume += amount
 
         if referrer.referrer_id:
-            level_referrer_db = await session.exec(select(User).where(User.uid == referrer.referrer_id))
+            level_referrer_db = await session.exec(select(User).where(User.uid == referrer.referrer_id).options(*user_load_options(UserLoadProfile.AUTH)))
             level_referrer = level_referrer_db.first()
             await self.calc_team_volume(level_referrer, amount, level + 1, session)
         return None
 
-    async def transferToAdminWallet(self, user: User, amount: Decimal, session: AsyncSession):
-        """Transfer the current sui wallet balance of a user to the admin wallet specified in the tokenMeter"""
-        db_result = await session.exec(select(TokenMeter))
-        token_meter: Optional[TokenMeter] = db_result.first()
-        t_amount = round(amount * Decimal(10**9))
+    async def get_token_meter(self, session: AsyncSession) -> TokenMeterInfo:
+        """Return the static token meter fields, read from the database once per process until an admin edits the meter."""
+        async def load() -> Optional[TokenMeterInfo]:
+            db_result = await session.exec(
+                select(TokenMeter.uid, TokenMeter.tokenAddress, TokenMeter.tokenPrivateKey, TokenMeter.tokenPrice, TokenMeter.totalCap)
+            )
+            row = db_result.first()
+            return TokenMeterInfo(*row) if row is not None else None
 
+        token_meter = await token_meter_cache.get(load)
         if token_meter is None:
             raise TokenMeterDoesNotExists()
+        return token_meter
+
+    async def add_to_token_meter_totals(self, uid: uuid.UUID, session: AsyncSession, **amounts: Decimal):
+        """Increment the meter counters in the database so concurrent deposits and withdrawals never overwrite each other."""
+        await session.exec(
+            update(TokenMeter)
+            .where(TokenMeter.uid == uid)
+            .values({name: getattr(TokenMeter, name) + amount for name, amount in amounts.items()})
+            .execution_options(synchronize_session=False)
+        )
+
+    async def transferToAdminWallet(self, user: User, amount: Decimal, session: AsyncSession):
+        """Transfer the current sui wallet balance of a user to the admin wallet specified in the tokenMeter"""
+        token_meter = await self.get_token_meter(session)
+        t_amount = round(amount * Decimal(10**9))
 
         try:
             gasStatus = await self.sendGasCoinForDeposit(user.wallet.address, token_meter, session)
@@ -592,7 +856,7 @@ class UserServices:
     #     transaction = await SUI.executeTransaction(transferResponse.txBytes, privKey)
     #     return transaction
 
-    async def sendGasCoinForDeposit(self, address: str, token_meter: TokenMeter, session: AsyncSession):
+    async def sendGasCoinForDeposit(self, address: str, token_meter: TokenMeterInfo, session: AsyncSession):
         # checks if the admin has enough for gas transfer
         adminCoinIds = await SUI.getCoins(token_meter.tokenAddress)
         adminGasCoin = next(
@@ -633,14 +897,13 @@ class UserServices:
         transaction = await SUI.transferFromSmartContract(amount, recipient, privKey)
         return transaction
 
-    async def handle_stake_logic(self, amount: Decimal, token_meter: TokenMeter, user: User, session: AsyncSession):
+    async def handle_stake_logic(self, amount: Decimal, token_meter: TokenMeterInfo, user: User, session: AsyncSession):
         """Core logic for handling the staking process."""
         now = datetime.now()
         amount_to_show = amount - Decimal(amount * Decimal(0.1))
         sbt_amount = amount * Decimal(0.1)
 
-        token_meter.totalAmountCollected += sbt_amount
-        token_meter.totalDeposited += amount
+        await self.add_to_token_meter_totals(token_meter.uid, session, totalAmountCollected=sbt_amount, totalDeposited=amount)
         user.staking.deposit += amount_to_show
 
         await self.update_amount_of_sui_token_earned(token_meter.tokenPrice, sbt_amount, user, session)
@@ -711,17 +974,20 @@ class UserServices:
         try:
             await self._update_user_balance(user, deposit_amount, session)
 
+            queue_user_event(session, user.userId, "deposit", {
+                "amount": deposit_amount,
+                "balance": user.wallet.balance,
+                "pendingBalance": user.wallet.pendingBalance,
+                "totalDeposit": user.wallet.totalDeposit,
+            })
+
             if deposit_amount < STAKING_MIN:
                 await session.commit()
                 await session.refresh(user)
                 return
 
             # get ttoken meter details
-            db_token_meter = await session.exec(select(TokenMeter))
-            token_meter = db_token_meter.first()
-
-            if token_meter is None:
-                raise TokenMeterDoesNotExists()
+            token_meter = await self.get_token_meter(session)
 
             # perform stake calculations
             try:
@@ -730,7 +996,7 @@ class UserServices:
                 raise HTTPException(status_code=400, detail="Staking Failed")
 
             if user.referrer_id:
-                db_result = await session.exec(select(User).where(User.uid == user.referrer_id))
+                db_result = await session.exec(select(User).where(User.uid == user.referrer_id).options(*user_load_options(UserLoadProfile.STAKING)))
                 user_referrer = db_result.first()
 
                 if user.isMakingFirstDeposit:
@@ -754,6 +1020,11 @@ class UserServices:
                 raise HTTPException(
                     status_code=400, detail=f"There was a transfer failure with this transaction: {transactionData}")
 
+            queue_user_event(session, user.userId, "stake", {
+                "stake": user.staking.deposit,
+                "roi": user.staking.roi,
+                "totalTokenPurchased": user.wallet.totalTokenPurchased,
+            })
             await session.commit()
             await session.refresh(user)
         except Exception as e:
@@ -769,7 +1040,7 @@ class UserServices:
             LOGGER.debug("Reached the maximum referral level.")
             return None
 
-        db_result = await session.exec(select(User).where(User.userId == referrer))
+        db_result = await session.exec(select(User).where(User.userId == referrer).options(*user_load_options(UserLoadProfile.STAKING)))
         referring_user = db_result.first()
 
         if not referring_user:
@@ -777,7 +1048,7 @@ class UserServices:
             raise Exception("Incorrect referring user object")
 
         LOGGER.debug(
-            f"passed user check:: {referring_user.userId}, referrer referrer: {referring_user.referrer.userId if referring_user.referrer else None}")
+            f"passed user check:: {referring_user.userId}, referrer referrer: {referring_user.referrer_id}")
 
         rf_db = await session.exec(select(UserReferral).where(UserReferral.theirUserId == referral.userId).where(UserReferral.userId == referrer))
         referral_to_update = rf_db.first()
@@ -812,7 +1083,7 @@ class UserServices:
         session.add(ref_activity)
 
         if referring_user.referrer_id:
-            db_result = await session.exec(select(User).where(User.uid == referring_user.referrer_id))
+            db_result = await session.exec(select(User).where(User.uid == referring_user.referrer_id).options(*user_load_options(UserLoadProfile.AUTH)))
             user_referrer = db_result.first()
 
             if user_referrer:
@@ -830,18 +1101,16 @@ class UserServices:
     # ##### TODO:END
 
     async def record_speed_boost(self, user: User, session: AsyncSession):
-        total_team_volume = Decimal(0.000000000)
         user_total_deposit = user.staking.deposit
 
-        user_referrals_query = await session.exec(select(UserReferral).where(UserReferral.userId == user.userId).where(UserReferral.level == 1))
-
-        referrals = user_referrals_query.all()
-
-        for ref in referrals:
-            refd_query = await session.exec(select(User).where(User.uid == ref.userUid))
-            refd = refd_query.first()
-            if refd:
-                total_team_volume += refd.staking.deposit
+        # sum the stakes of every direct referral in one query
+        team_volume_query = await session.exec(
+            select(func.coalesce(func.sum(UserStaking.deposit), 0))
+            .join(UserReferral, UserReferral.userUid == UserStaking.userUid)
+            .where(UserReferral.userId == user.userId)
+            .where(UserReferral.level == 1)
+        )
+        total_team_volume = Decimal(team_volume_query.one())
 
         if total_team_volume >= (user_total_deposit * 2):
             user.staking.roi += Decimal(0.005)
@@ -849,13 +1118,64 @@ class UserServices:
 
             # Todo: Add activity for speed boost
 
+    async def apply_fast_bonuses(self, session: AsyncSession) -> int:
+        """
+        Credit the fast bonus to every user who staked within 24 hours of joining and
+        brought in at least two level 1 referrals with a stake of their own. Eligibility
+        is computed in one grouped query and the bonus applied with bulk updates.
+        """
+        now = datetime.now()
+        original_deposit = UserStaking.deposit / (1 - TOKEN_PURCHASE_PERCENT)
+
+        active_referrals = (
+            select(UserReferral.userId.label("userId"))
+            .join(UserStaking, UserStaking.userUid == UserReferral.userUid)
+            .where(UserReferral.level == 1)
+            .where(original_deposit >= 1)
+            .group_by(UserReferral.userId)
+            .having(func.count(UserReferral.uid) >= FAST_BONUS_MIN_REFERRALS)
+            .subquery()
+        )
+
+        db_result = await session.exec(
+            select(User.uid)
+            .join(UserStaking, UserStaking.userUid == User.uid)
+            .join(active_referrals, active_referrals.c.userId == User.userId)
+            .where(User.isBlocked == False)
+            .where(User.isAdmin == False)
+            .where(User.hasMadeFirstDeposit == False)
+            .where(User.joined >= now - FAST_BONUS_WINDOW)
+            .where(original_deposit >= 1)
+        )
+        eligible = db_result.all()
+
+        if not eligible:
+            return 0
+
+        await session.exec(
+            update(UserWallet)
+            .where(UserWallet.userUid.in_(eligible))
+            .values(totalFastBonus=UserWallet.totalFastBonus + Decimal(1.00))
+            .execution_options(synchronize_session=False)
+        )
+        await session.exec(
+            update(UserStaking)
+            .where(UserStaking.userUid.in_(eligible))
+            .values(deposit=UserStaking.deposit + Decimal(1.00))
+            .execution_options(synchronize_session=False)
+        )
+        await session.exec(
+            update(User)
+            .where(User.uid.in_(eligible))
+            .values(hasMadeFirstDeposit=True)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        return len(eligible)
+
     async def transferFromAdminWallet(self, wallet: str, amount: Decimal, session: AsyncSession):
         """Transfer the current sui wallet balance of a user to the admin wallet specified in the tokenMeter"""
-        db_result = await session.exec(select(TokenMeter))
-        token_meter: Optional[TokenMeter] = db_result.first()
-
-        if token_meter is None:
-            raise TokenMeterDoesNotExists()
+        token_meter = await self.get_token_meter(session)
 
         try:
             status = await self.performTransactionFromAdmin(amount, wallet, token_meter.tokenAddress, token_meter.tokenPrivateKey)
@@ -867,7 +1187,7 @@ class UserServices:
             raise HTTPException(status_code=400, detail=str(e))
 
     async def referralEarningFromWithdrawnAmount(self, user: User, deposit_amount: Decimal, referrer_id: str, session: AsyncSession):
-        db_result = await session.exec(select(User).where(User.userId == referrer_id))
+        db_result = await session.exec(select(User).where(User.userId == referrer_id).options(*user_load_options(UserLoadProfile.AUTH)))
         user_referrer = db_result.first()
 
         # if not user.hasMadeFirstDeposit:
@@ -878,13 +1198,9 @@ class UserServices:
 
     async def withdrawToUserWallet(self, user: User, withdrawal_wallet: str, session: AsyncSession):
         """Transfer the current sui wallet balance of a user to the admin wallet specified in the tokenMeter"""
-        now = datetime.now()
         usdPrice = await get_sui_usd_price()
-        db_result = await session.exec(select(TokenMeter))
-        token_meter: Optional[TokenMeter] = db_result.first()
+        token_meter = await self.get_token_meter(session)
 
-        if token_meter is None:
-            raise TokenMeterDoesNotExists()
         if user.staking.deposit < 1:
             raise HTTPException(
                 status_code=400, detail="You have not initialized a stake. Please do so before u can withdraw.")
@@ -892,8 +1208,6 @@ class UserServices:
         if user.wallet.earnings < Decimal(1):
             raise InsufficientBalance()
 
-        sevenDaysLater = now + timedelta(days=7)
-
         # perform the calculatios in the ratio 60:20:10:10
         try:
             withdawable_amount = user.wallet.earnings * Decimal(0.6)
@@ -919,7 +1233,7 @@ class UserServices:
             user.wallet.totalWithdrawn += withdawable_amount
             user.staking.deposit += redepositable_amount
             if user.referrer_id:
-                db_result = await session.exec(select(User).where(User.uid == user.referrer_id))
+                db_result = await session.exec(select(User).where(User.uid == user.referrer_id).options(*user_load_options(UserLoadProfile.AUTH)))
                 user_referrer = db_result.first()
                 await self.referralEarningFromWithdrawnAmount(user, redepositable_amount, user_referrer.userId, session)
             # user.staking.roi = Decimal(0.015)
@@ -930,30 +1244,29 @@ class UserServices:
                                       strDetail="New deposit added from withdrawal", suiAmount=redepositable_amount, userUid=user.uid)
             session.add(new_activity)
 
-            # Share another 10% to the global matrix pool
-            matrix_db = await session.exec(select(MatrixPool).where(MatrixPool.endDate >= now))
-            active_matrix_pool_or_new = matrix_db.first()
-
-            # confirm there is an active matrix pool to add another 10% of the earning into
-            if not active_matrix_pool_or_new:
-                active_matrix_pool_or_new = MatrixPool(uid=uuid.uuid4(),
-                                                       raisedPoolAmount=Decimal(0),
-                                                       startDate=now, endDate=sevenDaysLater)
-                session.add(active_matrix_pool_or_new)
+            # Share another 10% to the global matrix pool, one is opened if the rollover has not done so yet
+            active_pool = await matrix_pool_services.get_active_pool_info(session)
+            await matrix_pool_services.add_to_pool_totals(active_pool.uid, session, raisedPoolAmount=matrix_pool_amount)
 
-            # if there is no active matrix pool then create one for the next 7 days and add the 10% from the withdrawal into it
-            active_matrix_pool_or_new.raisedPoolAmount += matrix_pool_amount
-
-            token_meter.totalAmountCollected += token_meter_amount
-            token_meter.totalSentToGMP += matrix_pool_amount
-            token_meter.totalWithdrawn += user.wallet.earnings
+            await self.add_to_token_meter_totals(
+                token_meter.uid,
+                session,
+                totalAmountCollected=token_meter_amount,
+                totalSentToGMP=matrix_pool_amount,
+                totalWithdrawn=withdawable_amount,
+            )
 
             new_activity = Activities(activityType=ActivityType.MATRIXPOOL,
                                       strDetail="Matrix Pool amount topped up", suiAmount=matrix_pool_amount, userUid=user.uid)
             session.add(new_activity)
 
+            queue_user_event(session, user.userId, "withdrawal", {
+                "amount": withdawable_amount,
+                "earnings": user.wallet.earnings,
+                "totalWithdrawn": user.wallet.totalWithdrawn,
+                "stake": user.staking.deposit,
+            })
             await session.commit()
-            await session.refresh(active_matrix_pool_or_new)
 
             transactionData = await self.transferFromAdminWallet(withdrawal_wallet, t_amount, session)
             if "failure" in transactionData and transactionData is not None:
@@ -964,3 +1277,298 @@ class UserServices:
             await session.rollback()
 
     # ##### UNVERIFIED ENDING
+
+
+class MatrixPoolServices:
+    async def update_pool_standings(self, pool: MatrixPool, session: AsyncSession):
+        """
+        Compute every member's share, earning and position for a pool in a single
+        windowed select and write them back with one UPDATE ... FROM statement.
+        """
+        member_name = (
+            select(func.coalesce(User.firstName, User.lastName))
+            .where(User.userId == MatrixPoolUsers.userId)
+            .limit(1)
+            .scalar_subquery()
+        )
+        share = cast(MatrixPoolUsers.referralsAdded, Numeric) * 100 / func.sum(MatrixPoolUsers.referralsAdded).over()
+
+        standings = (
+            select(
+                MatrixPoolUsers.uid.label("uid"),
+                share.label("share"),
+                (share * literal(pool.raisedPoolAmount, Numeric) / 100).label("earning"),
+                func.rank().over(order_by=MatrixPoolUsers.referralsAdded.desc()).label("position"),
+                func.coalesce(MatrixPoolUsers.name, member_name, MatrixPoolUsers.userId).label("name"),
+            )
+            .where(MatrixPoolUsers.matrixPoolUid == pool.uid)
+            .subquery()
+        )
+
+        await session.exec(
+            update(MatrixPoolUsers)
+            .where(MatrixPoolUsers.uid == standings.c.uid)
+            .values(
+                matrixShare=standings.c.share,
+                matrixEarninig=standings.c.earning,
+                position=standings.c.position,
+                name=standings.c.name,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        queue_user_event(session, None, "matrix_pool", {
+            "uid": pool.uid,
+            "raisedPoolAmount": pool.raisedPoolAmount,
+            "totalReferrals": pool.totalReferrals,
+        })
+
+    async def credit_pool_payouts(self, pool: MatrixPool, session: AsyncSession):
+        """
+        Pay every pool member exactly once. Payouts are first recorded in the ledger with
+        an insert-select that skips members already paid for this pool, then the unapplied
+        ledger rows are marked and credited to wallets in one statement, so a retried or
+        repeated run never pays twice. Only `close_pool` calls this, once the pool has ended
+        and its standings can no longer change.
+        """
+        now = datetime.now()
+        await session.exec(
+            pg_insert(MatrixPoolPayout)
+            .from_select(
+                ["uid", "matrixPoolUid", "userUid", "userId", "amount", "matrixShare", "created"],
+                select(
+                    func.gen_random_uuid(),
+                    MatrixPoolUsers.matrixPoolUid,
+                    User.uid,
+                    MatrixPoolUsers.userId,
+                    MatrixPoolUsers.matrixEarninig,
+                    MatrixPoolUsers.matrixShare,
+                    literal(now),
+                )
+                .join(User, User.userId == MatrixPoolUsers.userId)
+                .where(MatrixPoolUsers.matrixPoolUid == pool.uid)
+                .where(MatrixPoolUsers.matrixEarninig > 0),
+            )
+            .on_conflict_do_nothing(index_elements=["matrixPoolUid", "userUid"])
+        )
+
+        applied = (
+            update(MatrixPoolPayout)
+            .where(MatrixPoolPayout.matrixPoolUid == pool.uid)
+            .where(MatrixPoolPayout.appliedAt == None)
+            .values(appliedAt=now)
+            .returning(MatrixPoolPayout.userUid, MatrixPoolPayout.userId, MatrixPoolPayout.amount)
+            .cte("applied")
+        )
+
+        credited = await session.exec(
+            update(UserWallet)
+            .where(UserWallet.userUid == applied.c.userUid)
+            .values(
+                earnings=UserWallet.earnings + applied.c.amount,
+                availableReferralEarning=UserWallet.availableReferralEarning + applied.c.amount,
+                totalReferralEarnings=func.coalesce(UserWallet.totalReferralEarnings, 0) + applied.c.amount,
+            )
+            .returning(applied.c.userId, applied.c.amount, UserWallet.earnings)
+            .execution_options(synchronize_session=False)
+        )
+        for userId, amount, earnings in credited.all():
+            queue_user_event(session, userId, "matrix_pool_payout", {"poolUid": pool.uid, "amount": amount, "earnings": earnings})
+
+    async def get_active_pool_uid(self, session: AsyncSession) -> Optional[uuid.UUID]:
+        active_pool = await self.get_active_pool_info(session, create=False)
+        return active_pool.uid if active_pool is not None else None
+
+    async def get_active_pool_info(self, session: AsyncSession, create: bool = True) -> Optional[ActivePoolInfo]:
+        """
+        Return the id and dates of the running pool from the process cache, which expires with the
+        pool, so writers can address it by primary key without loading the row
+        """
+        async def load() -> Optional[ActivePoolInfo]:
+            pool = await self.get_active_pool(session, create=False)
+            return ActivePoolInfo(pool.uid, pool.startDate, pool.endDate) if pool is not None else None
+
+        active_pool = await active_pool_cache.get(load, expires=lambda active_pool: active_pool.endDate)
+        if active_pool is None and create:
+            # not cached, the new pool only exists once the caller commits
+            pool = await self._open_pool_now(session)
+            active_pool = ActivePoolInfo(pool.uid, pool.startDate, pool.endDate)
+        return active_pool
+
+    async def add_to_pool_totals(self, uid: uuid.UUID, session: AsyncSession, **amounts):
+        """Increment the pool counters in the database without loading the pool row."""
+        await session.exec(
+            update(MatrixPool)
+            .where(MatrixPool.uid == uid)
+            .values({name: getattr(MatrixPool, name) + amount for name, amount in amounts.items()})
+            .execution_options(synchronize_session=False)
+        )
+
+    async def _current_pool(self, session: AsyncSession) -> Optional[MatrixPool]:
+        now = datetime.now()
+        db_result = await session.exec(
+            select(MatrixPool)
+            .where(MatrixPool.startDate <= now)
+            .where(MatrixPool.endDate > now)
+            .order_by(MatrixPool.startDate.desc())
+            .options(noload(MatrixPool.users))
+        )
+        return db_result.first()
+
+    async def open_pool(self, startDate: datetime, session: AsyncSession) -> MatrixPool:
+        pool = MatrixPool(
+            uid=uuid.uuid4(),
+            raisedPoolAmount=Decimal(0),
+            totalReferrals=0,
+            startDate=startDate,
+            endDate=startDate + MATRIX_POOL_DURATION,
+        )
+        session.add(pool)
+        return pool
+
+    async def _lock_pools(self, session: AsyncSession) -> None:
+        """Serialise pool opening between processes until the session's transaction ends."""
+        await session.exec(select(func.pg_advisory_xact_lock(MATRIX_POOL_LOCK_KEY)))
+
+    async def _open_pool_now(self, session: AsyncSession) -> MatrixPool:
+        """Open a pool starting now for writers that found none running."""
+        await self._lock_pools(session)
+        # another writer or the rollover may have opened one while we waited for the lock
+        pool = await self._current_pool(session)
+        if pool is not None:
+            return pool
+
+        pool = await self.open_pool(datetime.now(), session)
+        # written straight away so its counters can be incremented by primary key before the commit
+        await session.flush()
+        session.info[PENDING_ACTIVE_POOL] = (pool.uid, pool.endDate)
+        return pool
+
+    async def get_active_pool(self, session: AsyncSession, create: bool = True) -> Optional[MatrixPool]:
+        """
+        Return the running pool by primary key using the id cached by the rollover, only
+        falling back to a time-range lookup when the cache is cold. When no pool is running
+        and `create` is set a new one is opened, as the rollover normally does ahead of time.
+        """
+        active_pool = active_pool_cache.peek()
+        poolUid = active_pool.uid if active_pool is not None else await get_active_matrix_pool_uid()
+        if poolUid is not None:
+            pool = await session.get(MatrixPool, poolUid, options=[noload(MatrixPool.users)])
+            if pool is not None:
+                return pool
+
+        pool = await self._current_pool(session)
+        if pool is None:
+            if not create:
+                return None
+            return await self._open_pool_now(session)
+
+        await set_active_matrix_pool(pool.uid, pool.endDate)
+        return pool
+
+    async def close_pool(self, pool: MatrixPool, session: AsyncSession):
+        """Settle a finished pool and freeze its final standings into the snapshot table."""
+        await self.update_pool_standings(pool, session)
+        await self.credit_pool_payouts(pool, session)
+
+        await session.exec(
+            pg_insert(MatrixPoolSnapshot)
+            .from_select(
+                ["uid", "matrixPoolUid", "userId", "name", "position", "referralsAdded", "matrixShare", "matrixEarninig", "startDate", "endDate"],
+                select(
+                    func.gen_random_uuid(),
+                    MatrixPoolUsers.matrixPoolUid,
+                    MatrixPoolUsers.userId,
+                    MatrixPoolUsers.name,
+                    MatrixPoolUsers.position,
+                    MatrixPoolUsers.referralsAdded,
+                    MatrixPoolUsers.matrixShare,
+                    MatrixPoolUsers.matrixEarninig,
+                    literal(pool.startDate),
+                    literal(pool.endDate),
+                )
+                .where(MatrixPoolUsers.matrixPoolUid == pool.uid),
+            )
+            .on_conflict_do_nothing(index_elements=["matrixPoolUid", "userId"])
+        )
+        pool.closedAt = datetime.now()
+
+    async def rollover_pools(self, session: AsyncSession):
+        """
+        Close every pool whose endDate has passed and make sure the next pool is open
+        before the current one ends, so writers never have to create pools lazily.
+        """
+        now = datetime.now()
+        await self._lock_pools(session)
+        db_result = await session.exec(
+            select(MatrixPool)
+            .where(MatrixPool.endDate <= now)
+            .where(MatrixPool.closedAt == None)
+            .options(noload(MatrixPool.users))
+        )
+        for pool in db_result.all():
+            await self.close_pool(pool, session)
+            await session.commit()
+            await self._lock_pools(session)
+
+        db_result = await session.exec(
+            select(MatrixPool).where(MatrixPool.endDate > now).order_by(MatrixPool.endDate.desc()).options(noload(MatrixPool.users))
+        )
+        latest = db_result.first()
+
+        if latest is None:
+            latest = await self.open_pool(now, session)
+        elif latest.endDate - now <= MATRIX_POOL_LEAD_TIME:
+            await self.open_pool(latest.endDate, session)
+        await session.commit()
+
+        current = await self._current_pool(session)
+        if current is not None:
+            await set_active_matrix_pool(current.uid, current.endDate)
+        await active_pool_cache.drop()
+
+    async def get_pool_history(self, userId: str, session: AsyncSession):
+        db_result = await session.exec(
+            select(MatrixPoolSnapshot)
+            .where(MatrixPoolSnapshot.userId == userId)
+            .order_by(MatrixPoolSnapshot.endDate.desc())
+        )
+        return db_result.all()
+
+    async def sync_pool_board(self, poolUid: uuid.UUID, session: AsyncSession):
+        """Rebuild the redis leaderboard of a pool from its members in the database."""
+        db_pool = await session.exec(select(MatrixPool.endDate).where(MatrixPool.uid == poolUid))
+        endDate = db_pool.first()
+        if endDate is None:
+            return None
+
+        db_result = await session.exec(
+            select(MatrixPoolUsers.userId, MatrixPoolUsers.referralsAdded, MatrixPoolUsers.name)
+            .where(MatrixPoolUsers.matrixPoolUid == poolUid)
+        )
+        members = {userId: (referralsAdded, name) for userId, referralsAdded, name in db_result.all()}
+        await sync_matrix_pool_board(poolUid, endDate, members)
+
+    async def get_live_position(self, userId: str, session: AsyncSession) -> Optional[dict]:
+        poolUid = await self.get_active_pool_uid(session)
+        if poolUid is None:
+            raise MatrixPoolNotFound()
+
+        if not await matrix_pool_board_exists(poolUid):
+            await self.sync_pool_board(poolUid, session)
+        return await get_matrix_pool_position(poolUid, userId)
+
+    async def get_live_board(self, limit: int, session: AsyncSession) -> dict:
+        poolUid = await self.get_active_pool_uid(session)
+        if poolUid is None:
+            raise MatrixPoolNotFound()
+
+        if not await matrix_pool_board_exists(poolUid):
+            await self.sync_pool_board(poolUid, session)
+        users = await get_matrix_pool_board(poolUid, limit)
+        return {
+            "matrixPoolUid": poolUid,
+            "users": users,
+        }
+
+
+matrix_pool_services = MatrixPoolServices()
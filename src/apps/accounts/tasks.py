@@ -12,19 +12,22 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 
 import ast
 
-from src.apps.accounts.models import MatrixPool, MatrixPoolUsers, TokenMeter, User, UserReferral, UserStaking, UserWallet
+from src.apps.accounts.enum import UserLoadProfile
+from src.apps.accounts.models import MatrixPool, MatrixPoolUsers, TokenMeter, User, UserReferral, UserStaking, UserWallet, user_load_options
 import yfinance as yf
 
-from src.apps.accounts.services import UserServices
+from src.apps.accounts.services import AdminServices, MatrixPoolServices, UserServices
 from src.celery_tasks import celery_app
 from src.db import engine
 from src.db.engine import get_session, get_session_context
 from src.db.redis import redis_client
-from src.utils.calculations import get_rank, matrix_share
+from src.utils.calculations import get_rank
 from src.utils.logger import LOGGER
 from sqlmodel import select
 
+admin_services = AdminServices()
 user_services = UserServices()
+matrix_pool_services = MatrixPoolServices()
 
 @celery_app.task(name="fetch_sui_usd_price_hourly")
 def fetch_sui_usd_price_hourly():
@@ -47,13 +50,6 @@ def run_calculate_daily_tasks():
     loop.run_until_complete(calculate_daily_tasks())
     loop.close()
 
-@celery_app.task(name="run_create_matrix_pool")
-def run_create_matrix_pool():
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(create_matrix_pool())
-    loop.close()
-
 @celery_app.task(name="run_calculate_users_matrix_pool_share")
 def run_calculate_users_matrix_pool_share():
     loop = asyncio.new_event_loop()
@@ -66,6 +62,7 @@ async def run_cncurrent_tasks():
     async with asyncio.TaskGroup() as group:
         group.create_task(fetch_sui_price())
         group.create_task(add_fast_bonus())
+        group.create_task(refresh_statistics())
 
     await group
 
@@ -83,7 +80,7 @@ async def fetch_sui_balance():
     async with get_session_context() as session:
         try:
             now = datetime.now()
-            user_db = await session.exec(select(User).where(User.isBlocked == False))
+            user_db = await session.exec(select(User).where(User.isBlocked == False).options(*user_load_options(UserLoadProfile.STAKING)))
             users = user_db.all()
 
             for user in users:
@@ -97,30 +94,14 @@ async def fetch_sui_balance():
 async def calculate_users_matrix_pool_share():
     async with get_session_context() as session:
         try:
-            now = datetime.now()
             # ###### CALCULATE USERS SHARE TO AN ACTIVE POOL
-            matrix_db = await session.exec(select(MatrixPool).where(MatrixPool.endDate >= now))
-            active_matrix_pool_or_new: Optional[MatrixPool] = matrix_db.first()
+            # payouts are only credited by the rollover once the pool has ended
+            active_matrix_pool_or_new = await matrix_pool_services.get_active_pool(session, create=False)
 
             if active_matrix_pool_or_new:
-                payoutTime = active_matrix_pool_or_new.endDate + timedelta(minutes=30)
-                mp_users_db = await session.exec(select(MatrixPoolUsers).where(MatrixPoolUsers.matrixPoolUid == active_matrix_pool_or_new.uid))
-                mp_users: List[MatrixPoolUsers] = mp_users_db.all()
-
-                for mp_user in mp_users:
-                    percentage, earning = await matrix_share(mp_user)
-                    mp_user.matrixShare = percentage
-                    mp_user.matrixEarning = earning
-                    if active_matrix_pool_or_new.endDate <= payoutTime:
-                        mpu_db = await session.exec(select(User).where(User.userId == mp_user.userId))
-                        mpu: Optional[User] = mpu_db.first()
-
-                        mpu.wallet.earnings += earning
-                        mpu.wallet.availableReferralEarning += earning
-                        mpu.wallet.totalReferralEarnings += earning
-
-                    await session.commit()
-                    await session.refresh(mp_user)
+                await matrix_pool_services.update_pool_standings(active_matrix_pool_or_new, session)
+                await session.commit()
+                await matrix_pool_services.sync_pool_board(active_matrix_pool_or_new.uid, session)
             await session.close()
         except Exception as e:
             LOGGER.error(e)
@@ -130,7 +111,7 @@ async def calculate_daily_tasks():
     async with get_session_context() as session:
         try:
             now = datetime.now()
-            user_db = await session.exec(select(User).where(User.isBlocked == False))
+            user_db = await session.exec(select(User).where(User.isBlocked == False).options(*user_load_options(UserLoadProfile.STAKING)))
             users: List[User] = user_db.all()
 
             for user in users:
@@ -188,20 +169,10 @@ async def calculate_daily_tasks():
             LOGGER.error(e)
             await session.close()
 
-async def create_matrix_pool():
+async def refresh_statistics():
     async with get_session_context() as session:
         try:
-            now = datetime.now()
-            matrix_db = await session.exec(select(MatrixPool).where(MatrixPool.endDate >= now))
-            active_matrix_pool_or_new = matrix_db.first()
-            sevenDaysLater = now + timedelta(days=7)
-
-            if active_matrix_pool_or_new is None:
-                new_pool = MatrixPool(
-                    poolAmount=Decimal(0), startDate=now, endDate=sevenDaysLater
-                )
-                session.add(new_pool)
-                await session.commit()
+            await admin_services.refreshStatistics(session)
             await session.close()
         except Exception as e:
             LOGGER.error(e)
@@ -211,31 +182,7 @@ async def create_matrix_pool():
 async def add_fast_bonus():
     async with get_session_context() as session:
         try:
-            now = datetime.now()
-            user_db = await session.exec(select(User).where(User.isBlocked == False))
-            users: List[User] = user_db.all()
-
-            for user in users:
-                ref_db = await session.exec(select(UserReferral).where(UserReferral.userId == user.userId))
-                refs: List[UserReferral] = ref_db.all()
-
-                if refs.level == 1:
-                    fast_boost_time = user.joined + timedelta(hours=24)
-                    # db_referrals = await session.exec(select(UserReferral).where(UserReferral.userId == referring_user.userId).where(UserReferral.level == 1))
-                    # referrals = db_referrals.all()
-
-                    paid_users = []
-                    for u in refs:
-                        ref_db = await session.exec(select(User).where(User.userId == u.userId))
-                        referrer = ref_db.first()
-                        if referrer and referrer.staking.deposit >= Decimal(1):
-                            paid_users.append(u)
-
-                    if user.joined < fast_boost_time and len(paid_users) >= 2:
-                        user.wallet.totalFastBonus += Decimal(1.00)
-                        user.staking.deposit += Decimal(1.00)
-
-                # ###### CHECK IF THE REFERRING USER HAS A REFERRER THEN REPEAT THE PROCESS AGAIN
+            await user_services.apply_fast_bonuses(session)
             await session.close()
         except Exception as e:
             LOGGER.error(e)
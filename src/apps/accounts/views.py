@@ -1,27 +1,34 @@
-from datetime import date, datetime, timedelta
+import asyncio
+import orjson
+from datetime import date, timedelta
 from decimal import Decimal
-from typing import Annotated, List, Optional
+from typing import Annotated, FrozenSet, List, Optional
 
 from fastapi import APIRouter, BackgroundTasks, Body, Depends, File, Path, Query, Request, UploadFile, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi_pagination import Page, paginate
 
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.apps.accounts.dependencies import AccessTokenBearer, RefreshTokenBearer, TokenBearer, admin_permission_check, get_current_user
-from src.apps.accounts.models import MatrixPool, MatrixPoolUsers, TokenMeter, User, UserReferral, UserWallet
-from src.apps.accounts.schemas import AccessToken, ActivitiesRead, AdminLogin, AllStatisticsRead, DeleteMessage, MatrixUsersRead, Message, MatrixPoolRead, MatrixUserCreateUpdate, RegAndLoginResponse, SignedTTransactionBytesMessage, StakingCreate, SuiDollarRate, TokenMeterCreate, TokenMeterRead, TokenMeterUpdate, UserCreateOrLoginSchema, UserLoginSchema, UserRead, UserUpdateSchema, UserWithReferralsRead, WithdrawEarning, Withdrawal
-from src.apps.accounts.services import AdminServices, UserServices
+from src.apps.accounts.dependencies import AccessTokenBearer, RefreshTokenBearer, TokenBearer, admin_permission_check, get_current_principal, get_current_user, user_sections
+from src.apps.accounts.enum import ExportFormat, UserLoadProfile, UserSection
+from src.apps.accounts.models import MatrixPool, MatrixPoolUsers, TokenMeter, User, UserReferral, UserWallet, user_load_options
+from src.apps.accounts.schemas import AccessToken, ActivitiesRead, AdminLogin, AllStatisticsRead, DeleteMessage, MatrixUsersRead, Message, MatrixPoolBoardRead, MatrixPoolRead, MatrixPoolSnapshotRead, MatrixPoolStandingRead, MatrixUserCreateUpdate, RegAndLoginResponse, SignedTTransactionBytesMessage, StakingCreate, SuiDollarRate, TokenMeterCreate, TokenMeterRead, TokenMeterUpdate, UserCreateOrLoginSchema, UserLoginSchema, UserPrincipal, UserBulkLookup, UserRead, UserUpdateSchema, UserWithReferralsRead, WithdrawEarning, Withdrawal, user_sections_exclude
+from src.apps.accounts.services import AdminServices, MatrixPoolServices, UserServices
 from src.celery_beat import TemplateScheduleSQLRepository
-from src.db.engine import get_session
+from src.db.engine import get_session, get_session_context
 from src.config.settings import Config
-from src.db.redis import add_jti_to_blocklist, get_level_referrers, get_sui_usd_price
-from src.errors import ActivePoolNotFound, InsufficientPermission, InvalidTelegramAuthData, InvalidToken, MatrixPoolNotFound, UserAlreadyExists, UserNotFound
-from src.utils.hashing import createAccessToken , verifyTelegramAuthData
+from src.db.redis import add_jti_to_blocklist, get_level_referrers, get_sui_usd_price, get_user_read, revoke_refresh_session, revoke_refresh_sessions, set_user_read, user_event_hub
+from src.middleware import no_compression
+from src.errors import ActivePoolNotFound, InsufficientPermission, InvalidTelegramAuthData, MatrixPoolNotFound, UserAlreadyExists, UserBlocked, UserNotFound
+from src.utils.export import EXPORT_MEDIA_TYPES
+from src.utils.http_cache import ResponseCache
+from src.utils.responses import FastJSONResponse, model_response, prune_document
 from src.utils.logger import LOGGER
 
 session = Annotated[AsyncSession, Depends(get_session)]
+sections = Annotated[Optional[FrozenSet[UserSection]], Depends(user_sections)]
 auth_router = APIRouter()
 user_router = APIRouter()
 stake_router = APIRouter()
@@ -29,8 +36,17 @@ matrix_router = APIRouter()
 
 admin_service = AdminServices()
 user_service = UserServices()
+matrix_pool_service = MatrixPoolServices()
 celery_beat = TemplateScheduleSQLRepository()
 
+# the sui rate and token meter move every few minutes at most, polling tabs are served from here
+SUI_RATE_CACHE_KEY = "sui_rate"
+TOKEN_METER_CACHE_KEY = "token_meter"
+public_cache = ResponseCache(ttl=30)
+
+# a comment line every so often keeps proxies from closing idle event streams
+USER_EVENTS_HEARTBEAT = 20
+
 
 @auth_router.post(
     "/start",
@@ -38,35 +54,16 @@ celery_beat = TemplateScheduleSQLRepository()
     response_model=RegAndLoginResponse,
     description="Initialize a new webapp instance for a user passing a `telegram_init_data` for authorization check and an `*optional* referrerId`(telegram userId) to create the level authorization. Within this endpoint is the function tto auto generate a unique wallet address and an initial activity record for the new user if it is their first time initializing the webapp else it automatically generates an accesstoken and refreshToken when the user is a returning user."
 )
-async def start(form_data: Annotated[UserCreateOrLoginSchema, Body()], session: session, referrer: Optional[str] = "7640164872"):
+async def start(form_data: Annotated[UserCreateOrLoginSchema, Body()], session: session, sections: sections, referrer: Optional[str] = "7640164872"):
     accessToken, refershToken, user = await user_service.register_new_user(form_data, session, referrer)
-    referralsLv1List = await session.exec(select(UserReferral).where(UserReferral.level == 1).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv2List = await session.exec(select(UserReferral).where(UserReferral.level == 2).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv3List = await session.exec(select(UserReferral).where(UserReferral.level == 3).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv4List = await session.exec(select(UserReferral).where(UserReferral.level == 4).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv5List = await session.exec(select(UserReferral).where(UserReferral.level == 5).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    LOGGER.debug(referralsLv2List.all())
-
-    referralsLv1 = referralsLv1List.all()
-    referralsLv2 = referralsLv2List.all()
-    referralsLv3 = referralsLv3List.all()
-    referralsLv4 = referralsLv4List.all()
-    referralsLv5 = referralsLv5List.all()
-
-    userResp = {
-        "user": user,
-        "referralsLv1": referralsLv1,
-        "referralsLv2": referralsLv2,
-        "referralsLv3": referralsLv3,
-        "referralsLv4": referralsLv4,
-        "referralsLv5": referralsLv5
-    }
-    return {
+    userResp = await user_service.get_user_with_referrals(user, session, sections)
+    exclude = user_sections_exclude(sections)
+    return model_response(RegAndLoginResponse, {
         "message": "Authorization Successful",
         "accessToken": accessToken,
         "refreshToken": refershToken,
         "user": userResp
-    }
+    }, status_code=status.HTTP_201_CREATED, exclude={"user": exclude} if exclude else None)
 
 @auth_router.post(
     "/start-without-ref",
@@ -74,35 +71,16 @@ async def start(form_data: Annotated[UserCreateOrLoginSchema, Body()], session:
     response_model=RegAndLoginResponse,
     description="Telegram auth login."
 )
-async def login(form_data: Annotated[UserLoginSchema, Body()], session: session):
+async def login(form_data: Annotated[UserLoginSchema, Body()], session: session, sections: sections):
     accessToken, refershToken, user = await user_service.login_user(form_data, session)
-    referralsLv1List = await session.exec(select(UserReferral).where(UserReferral.level == 1).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv2List = await session.exec(select(UserReferral).where(UserReferral.level == 2).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv3List = await session.exec(select(UserReferral).where(UserReferral.level == 3).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv4List = await session.exec(select(UserReferral).where(UserReferral.level == 4).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv5List = await session.exec(select(UserReferral).where(UserReferral.level == 5).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    LOGGER.debug(referralsLv2List.all())
-
-    referralsLv1 = referralsLv1List.all()
-    referralsLv2 = referralsLv2List.all()
-    referralsLv3 = referralsLv3List.all()
-    referralsLv4 = referralsLv4List.all()
-    referralsLv5 = referralsLv5List.all()
-
-    userResp = {
-        "user": user,
-        "referralsLv1": referralsLv1,
-        "referralsLv2": referralsLv2,
-        "referralsLv3": referralsLv3,
-        "referralsLv4": referralsLv4,
-        "referralsLv5": referralsLv5
-    }
-    return {
+    userResp = await user_service.get_user_with_referrals(user, session, sections)
+    exclude = user_sections_exclude(sections)
+    return model_response(RegAndLoginResponse, {
         "message": "Authorization Successful",
         "accessToken": accessToken,
         "refreshToken": refershToken,
         "user": userResp
-    }
+    }, exclude={"user": exclude} if exclude else None)
 
 @auth_router.post(
     "/admin-login",
@@ -112,32 +90,13 @@ async def login(form_data: Annotated[UserLoginSchema, Body()], session: session)
 )
 async def admin_login(request: Request, form_data: Annotated[AdminLogin, Body(...)], session: session):
     accessToken, refershToken, user = await user_service.authenticate_user(form_data, session)
-    referralsLv1List = await session.exec(select(UserReferral).where(UserReferral.level == 1).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv2List = await session.exec(select(UserReferral).where(UserReferral.level == 2).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv3List = await session.exec(select(UserReferral).where(UserReferral.level == 3).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv4List = await session.exec(select(UserReferral).where(UserReferral.level == 4).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv5List = await session.exec(select(UserReferral).where(UserReferral.level == 5).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-
-    referralsLv1 = referralsLv1List.all()
-    referralsLv2 = referralsLv2List.all()
-    referralsLv3 = referralsLv3List.all()
-    referralsLv4 = referralsLv4List.all()
-    referralsLv5 = referralsLv5List.all()
-
-    userResp = {
-        "user": user,
-        "referralsLv1": referralsLv1,
-        "referralsLv2": referralsLv2,
-        "referralsLv3": referralsLv3,
-        "referralsLv4": referralsLv4,
-        "referralsLv5": referralsLv5
-    }
-    return {
+    userResp = await user_service.get_user_with_referrals(user, session)
+    return model_response(RegAndLoginResponse, {
         "message": "Authorization Successful",
         "accessToken": accessToken,
         "refreshToken": refershToken,
         "user": userResp
-    }
+    })
 
 @auth_router.get(
     "/refresh-token",
@@ -146,39 +105,79 @@ async def admin_login(request: Request, form_data: Annotated[AdminLogin, Body(..
     description="Returns a specific user by providing their userId"
 )
 async def refresh_access_token(token: Annotated[dict, Depends(RefreshTokenBearer())], session: session):
-    expiry_timestamp = token["exp"]
+    # decoding the token already rejected it if it has expired
     userId = token["user"]["userId"]
 
-    if datetime.fromtimestamp(expiry_timestamp).date() < datetime.now().date():
-        raise InvalidToken()
-
+    # the refresh token is rotated, clients must keep the one returned here
+    new_access_token, new_refresh_token = await user_service.rotate_tokens(token)
     res_user = await user_service.return_user_by_userId(userId, session)
-    new_access_token = createAccessToken(user_data=token["user"])
     return {
         "message": "AccessToken generated successfully",
         "access_token": new_access_token,
+        "refresh_token": new_refresh_token,
         "user": res_user
     }
 
+@auth_router.post(
+    "/logout",
+    status_code=status.HTTP_200_OK,
+    response_model=DeleteMessage,
+    description="Ends the refresh session of the access token used and revokes the access token"
+)
+async def logout(token: Annotated[dict, Depends(AccessTokenBearer())]):
+    sessionId = token.get("sid")
+    if sessionId is not None:
+        await revoke_refresh_session(token["user"]["userId"], sessionId)
+    await add_jti_to_blocklist(token["jti"])
+    return {
+        "message": "Logged out successfully",
+    }
+
+@auth_router.post(
+    "/logout-all",
+    status_code=status.HTTP_200_OK,
+    response_model=DeleteMessage,
+    description="Ends every refresh session of the user so no device can get new access tokens, and revokes the access token used"
+)
+async def logout_all(token: Annotated[dict, Depends(AccessTokenBearer())]):
+    await revoke_refresh_sessions(token["user"]["userId"])
+    await add_jti_to_blocklist(token["jti"])
+    return {
+        "message": "Logged out of every session",
+    }
+
 @auth_router.get(
     "/get-users",
     status_code=status.HTTP_200_OK,
     response_model=Page[UserRead],
     description="This is an admin only endpoint that returns a paginated list of user datas"
 )
-async def get_users(user: Annotated[User, Depends(get_current_user)], session: session, date: Optional[date] = None):
+async def get_users(user: Annotated[UserPrincipal, Depends(get_current_principal)], session: session, date: Optional[date] = None):
     if not user.isAdmin:
         raise InsufficientPermission()
     users = await admin_service.getAllUsers(date, session)
     return paginate(users)
 
+@auth_router.post(
+    "/lookup-users",
+    status_code=status.HTTP_200_OK,
+    response_model=List[UserWithReferralsRead],
+    dependencies=[Depends(admin_permission_check)],
+    description="Returns the full user and referral payloads of up to a few hundred userIds in one request, unknown userIds are left out"
+)
+async def lookup_users(user: Annotated[UserPrincipal, Depends(get_current_principal)], form_data: Annotated[UserBulkLookup, Body()], session: session):
+    if not user.isAdmin:
+        raise InsufficientPermission()
+    usersResp = await user_service.get_users_with_referrals(form_data.userIds, session)
+    return model_response(List[UserWithReferralsRead], usersResp)
+
 @auth_router.get(
     "/get-transactions",
     status_code=status.HTTP_200_OK,
     response_model=Page[ActivitiesRead],
     description="Returns a paginated list of filtered actvities to an admin"
 )
-async def get_transactions(user: Annotated[User, Depends(get_current_user)], session: session, date: Optional[date] = None):
+async def get_transactions(user: Annotated[UserPrincipal, Depends(get_current_principal)], session: session, date: Optional[date] = None):
     if not user.isAdmin:
         raise InsufficientPermission()
     transactions = await admin_service.getAllTransactions(date, session)
@@ -190,12 +189,55 @@ async def get_transactions(user: Annotated[User, Depends(get_current_user)], ses
     response_model=Page[ActivitiesRead],
     description="Returns a paginated list of all actvities to an admin"
 )
-async def get_activities(user: Annotated[User, Depends(get_current_user)], session: session, date: Optional[date] = None):
+async def get_activities(user: Annotated[UserPrincipal, Depends(get_current_principal)], session: session, date: Optional[date] = None):
     if not user.isAdmin:
         raise InsufficientPermission()
     activities = await admin_service.getAllActivities(date, session)
     return paginate(activities)
 
+@auth_router.get(
+    "/statistics",
+    status_code=status.HTTP_200_OK,
+    response_model=AllStatisticsRead,
+    description="Returns the platform statistics to an admin, as last rolled up by the scheduled statistics job"
+)
+async def get_statistics(user: Annotated[UserPrincipal, Depends(get_current_principal)], session: session):
+    if not user.isAdmin:
+        raise InsufficientPermission()
+    return await admin_service.statRecord(session)
+
+@auth_router.get(
+    "/export-users",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    description="Streams every user with their wallet and stake totals to an admin as `ndjson` or `csv`, optionally only users who joined between `start` and `end`"
+)
+@no_compression
+async def export_users(user: Annotated[UserPrincipal, Depends(get_current_principal)], start: Optional[date] = None, end: Optional[date] = None, format: ExportFormat = ExportFormat.NDJSON):
+    if not user.isAdmin:
+        raise InsufficientPermission()
+    return StreamingResponse(
+        admin_service.exportUsers(start, end, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="users.{format.value}"'},
+    )
+
+@auth_router.get(
+    "/export-activities",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    description="Streams all activities to an admin as `ndjson` or `csv`, optionally only those created between `start` and `end`"
+)
+@no_compression
+async def export_activities(user: Annotated[UserPrincipal, Depends(get_current_principal)], start: Optional[date] = None, end: Optional[date] = None, format: ExportFormat = ExportFormat.NDJSON):
+    if not user.isAdmin:
+        raise InsufficientPermission()
+    return StreamingResponse(
+        admin_service.exportActivities(start, end, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="activities.{format.value}"'},
+    )
+
 @auth_router.patch(
     "/ban-user/{userId}",
     status_code=status.HTTP_200_OK,
@@ -203,7 +245,7 @@ async def get_activities(user: Annotated[User, Depends(get_current_user)], sessi
     dependencies=[Depends(admin_permission_check)],
     description="Ban a specific user"
 )
-async def ban_a_user(user: Annotated[User, Depends(get_current_user)], userId: str, session: session):
+async def ban_a_user(user: Annotated[UserPrincipal, Depends(get_current_principal)], userId: str, session: session):
     if not user.isAdmin:
         raise InsufficientPermission()
     isBanned = await admin_service.banUser(userId, session)
@@ -218,10 +260,11 @@ async def ban_a_user(user: Annotated[User, Depends(get_current_user)], userId: s
     dependencies=[Depends(admin_permission_check)],
     description="Create the token meter total capital, add an admin wallet address to transfer sui from individual user generated wallets into to show the meter bar."
 )
-async def create_token_meter(user: Annotated[User, Depends(get_current_user)], form_data: Annotated[TokenMeterCreate, Body()], session: session):
+async def create_token_meter(user: Annotated[UserPrincipal, Depends(get_current_principal)], form_data: Annotated[TokenMeterCreate, Body()], session: session):
     if not user.isAdmin:
         raise InsufficientPermission()
     tokenMeter = await admin_service.createTokenRecord(form_data, session)
+    public_cache.invalidate(TOKEN_METER_CACHE_KEY)
     return tokenMeter
 
 @auth_router.post(
@@ -231,7 +274,7 @@ async def create_token_meter(user: Annotated[User, Depends(get_current_user)], f
     dependencies=[Depends(admin_permission_check)],
     description="Adds a new user into the matrix pool user list for shares in the global matrix pool information."
 )
-async def add_new_pool_user(user: Annotated[User, Depends(get_current_user)], form_data: Annotated[MatrixUserCreateUpdate, Body()], session: session):
+async def add_new_pool_user(user: Annotated[UserPrincipal, Depends(get_current_principal)], form_data: Annotated[MatrixUserCreateUpdate, Body()], session: session):
     if not user.isAdmin:
         raise InsufficientPermission()
     matrix_user = await admin_service.addNewPoolUser(form_data, session)
@@ -246,10 +289,11 @@ async def add_new_pool_user(user: Annotated[User, Depends(get_current_user)], fo
     dependencies=[Depends(admin_permission_check)],
     description="update the token meter."
 )
-async def update_token_meter(user: Annotated[User, Depends(get_current_user)], form_data: Annotated[TokenMeterUpdate, Body()], session: session):
+async def update_token_meter(user: Annotated[UserPrincipal, Depends(get_current_principal)], form_data: Annotated[TokenMeterUpdate, Body()], session: session):
     if not user.isAdmin:
         raise InsufficientPermission()
     tokenMeter = await admin_service.updateTokenRecord(form_data, session)
+    public_cache.invalidate(TOKEN_METER_CACHE_KEY)
     return tokenMeter
 
 @auth_router.get(
@@ -259,31 +303,16 @@ async def update_token_meter(user: Annotated[User, Depends(get_current_user)], f
     dependencies=[Depends(admin_permission_check)],
     description="Returns a specific user to an admin"
 )
-async def get_a_user(user: Annotated[User, Depends(get_current_user)], userId: str, session: session):
+async def get_a_user(user: Annotated[UserPrincipal, Depends(get_current_principal)], userId: str, session: session, sections: sections):
     if not user.isAdmin:
         raise InsufficientPermission()
-    db_user = await session.exec(select(User).where(User.userId == userId))
-    user = db_user.first()
-    referralsLv1List = await session.exec(select(UserReferral).where(UserReferral.level == 1).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv2List = await session.exec(select(UserReferral).where(UserReferral.level == 2).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv3List = await session.exec(select(UserReferral).where(UserReferral.level == 3).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv4List = await session.exec(select(UserReferral).where(UserReferral.level == 4).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv5List = await session.exec(select(UserReferral).where(UserReferral.level == 5).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-
-    referralsLv1 = referralsLv1List.all()
-    referralsLv2 = referralsLv2List.all()
-    referralsLv3 = referralsLv3List.all()
-    referralsLv4 = referralsLv4List.all()
-    referralsLv5 = referralsLv5List.all()
-
-    return {
-        "user": user,
-        "referralsLv1": referralsLv1,
-        "referralsLv2": referralsLv2,
-        "referralsLv3": referralsLv3,
-        "referralsLv4": referralsLv4,
-        "referralsLv5": referralsLv5,
-    }
+    if sections is not None:
+        user = await user_service.get_sparse_user(userId, sections, session)
+    else:
+        db_user = await session.exec(select(User).where(User.userId == userId).options(*user_load_options(UserLoadProfile.DASHBOARD)))
+        user = db_user.first()
+    userResp = await user_service.get_user_with_referrals(user, session, sections)
+    return model_response(UserWithReferralsRead, userResp, exclude=user_sections_exclude(sections))
 
 @auth_router.delete(
     "/{userId}",
@@ -295,11 +324,11 @@ async def get_a_user(user: Annotated[User, Depends(get_current_user)], userId: s
 async def delete_a_user(userId: str, session: session):
     if not user.isAdmin:
         raise InsufficientPermission()
-    db_user = await session.exec(select(User).where(User.userId == userId))
+    db_user = await session.exec(select(User).where(User.userId == userId).options(*user_load_options(UserLoadProfile.ADMIN)))
     user = db_user.first()
     db_pool_users = await session.exec(select(MatrixPoolUsers).where(MatrixPoolUsers.userId == userId))
     all_pool = db_pool_users.all()
-    ref_db = await session.exec(select(User).where(User.userId == user.referrer.userId))
+    ref_db = await session.exec(select(User).where(User.userId == user.referrer.userId).options(*user_load_options(UserLoadProfile.AUTH)))
     referrer = ref_db.first()
 
     if referrer is not None:
@@ -338,33 +367,15 @@ async def delete_a_user(userId: str, session: session):
     dependencies=[Depends(admin_permission_check)],
     description="Update records for a specific user by providing their userId as a required field ad then the body form data to update with"
 )
-async def update_profile(user: Annotated[User, Depends(get_current_user)], userId: str, form_data: Annotated[UserUpdateSchema, Body()], session: session):
+async def update_profile(user: Annotated[UserPrincipal, Depends(get_current_principal)], userId: str, form_data: Annotated[UserUpdateSchema, Body()], session: session):
     if not user.isAdmin:
         raise InsufficientPermission()
-    db_user = await session.exec(select(User).where(User.userId == userId))
+    db_user = await session.exec(select(User).where(User.userId == userId).options(*user_load_options(UserLoadProfile.DASHBOARD)))
     user = db_user.first()
 
     res_user = await user_service.updateUserProfile(user, form_data, session)
-    referralsLv1List = await session.exec(select(UserReferral).where(UserReferral.level == 1).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv2List = await session.exec(select(UserReferral).where(UserReferral.level == 2).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv3List = await session.exec(select(UserReferral).where(UserReferral.level == 3).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv4List = await session.exec(select(UserReferral).where(UserReferral.level == 4).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv5List = await session.exec(select(UserReferral).where(UserReferral.level == 5).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-
-    referralsLv1 = referralsLv1List.all()
-    referralsLv2 = referralsLv2List.all()
-    referralsLv3 = referralsLv3List.all()
-    referralsLv4 = referralsLv4List.all()
-    referralsLv5 = referralsLv5List.all()
-
-    return {
-        "user": res_user,
-        "referralsLv1": referralsLv1,
-        "referralsLv2": referralsLv2,
-        "referralsLv3": referralsLv3,
-        "referralsLv4": referralsLv4,
-        "referralsLv5": referralsLv5,
-    }
+    userResp = await user_service.get_user_with_referrals(res_user, session)
+    return model_response(UserWithReferralsRead, userResp)
 
 
 
@@ -376,11 +387,12 @@ async def update_profile(user: Annotated[User, Depends(get_current_user)], userI
     response_model=SuiDollarRate,
     description="Get the rate of sui in dollars form yfinance"
 )
-async def get_sui_rate():
-    rate = await get_sui_usd_price()
-    return {
-        "rate": rate
-    }
+async def get_sui_rate(request: Request):
+    async def build() -> bytes:
+        rate = await get_sui_usd_price()
+        return SuiDollarRate(rate=rate).model_dump_json().encode()
+
+    return await public_cache.respond(request, SUI_RATE_CACHE_KEY, build)
 
 @user_router.get(
     "/token-meter",
@@ -388,9 +400,41 @@ async def get_sui_rate():
     response_model=Optional[TokenMeterRead],
     description="Get token meter."
 )
-async def get_token_meter(session: session):
-    db_result = await session.exec(select(TokenMeter))
-    return db_result.first()
+async def get_token_meter(request: Request):
+    async def build() -> bytes:
+        async with get_session_context() as db_session:
+            db_result = await db_session.exec(select(TokenMeter))
+            token_meter = db_result.first()
+        if token_meter is None:
+            return b"null"
+        return TokenMeterRead.model_validate(token_meter.model_dump()).model_dump_json().encode()
+
+    return await public_cache.respond(request, TOKEN_METER_CACHE_KEY, build)
+
+@user_router.get(
+    "/events",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    description="Server-sent event stream of the signed in user's balance, stake, withdrawal, rank and matrix pool deltas. Send the bearer token in the `Authorization` header (a fetch based EventSource) and apply the deltas instead of polling `/users/me`."
+)
+@no_compression
+async def user_events(request: Request, user: Annotated[UserPrincipal, Depends(get_current_principal)]):
+    async def stream():
+        async with user_event_hub.subscribe(user.userId) as queue:
+            yield b"retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout=USER_EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield frame
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @user_router.get(
     "/me",
@@ -399,38 +443,37 @@ async def get_token_meter(session: session):
     # dependencies=[Depends(get_current_user)],
     description="Returns a paginated list of all actvities to an admin"
 )
-async def me(user: Annotated[User, Depends(get_current_user)], session: session):
+async def me(token_data: Annotated[dict, Depends(AccessTokenBearer())], session: session, sections: sections):
+    userId = token_data["user"]["userId"]
+    exclude = user_sections_exclude(sections)
+    cached, generation = await get_user_read(userId)
+    if cached is not None:
+        if exclude is None:
+            return FastJSONResponse(content=cached)
+        return FastJSONResponse(content=prune_document(orjson.loads(cached), exclude))
+
+    if sections is not None:
+        # sparse documents are not cached, they cost a single query without referrals
+        user = await user_service.get_sparse_user(str(userId), sections, session)
+        if user.isBlocked:
+            raise UserBlocked()
+        userResp = await user_service.get_user_with_referrals(user, session, sections)
+        return model_response(UserWithReferralsRead, userResp, exclude=exclude)
+
+    user = await get_current_user(token_data, session)
     LOGGER.debug(f"user: {user}")
 
-    referralsLv1List = await session.exec(statement = select(UserReferral).where(UserReferral.level == 1).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv2List = await session.exec(statement = select(UserReferral).where(UserReferral.level == 2).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv3List = await session.exec(statement = select(UserReferral).where(UserReferral.level == 3).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv4List = await session.exec(statement = select(UserReferral).where(UserReferral.level == 4).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv5List = await session.exec(statement = select(UserReferral).where(UserReferral.level == 5).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-
-    referralsLv1 = referralsLv1List.all()
-    referralsLv2 = referralsLv2List.all()
-    referralsLv3 = referralsLv3List.all()
-    referralsLv4 = referralsLv4List.all()
-    referralsLv5 = referralsLv5List.all()
-
-    return {
-        "user": user,
-        "referralsLv1": referralsLv1,
-        "referralsLv2": referralsLv2,
-        "referralsLv3": referralsLv3,
-        "referralsLv4": referralsLv4,
-        "referralsLv5": referralsLv5,
-    }
+    payload = await user_service.serialise_user_with_referrals(user, session)
+    await set_user_read(user.userId, payload, generation)
+    return FastJSONResponse(content=payload)
 
 @user_router.get(
     "/referrals",
     status_code=status.HTTP_200_OK,
     response_model=Page[UserRead],
-    dependencies=[Depends(get_current_user)],
     description="Returns a paginated list of all referrals to an admin"
 )
-async def user_referrals(user: Annotated[User, Depends(get_current_user)], session: session, level: int):
+async def user_referrals(user: Annotated[UserPrincipal, Depends(get_current_principal)], session: session, level: int):
     LOGGER.debug(f"user: {user}")
     referrals = await user_service.get_user_downlines(user, level, session)
 
@@ -471,10 +514,9 @@ async def withdraw_from_earning(wallet: Annotated[Withdrawal, Body(...)], user:
     "/me/activities",
     status_code=status.HTTP_200_OK,
     response_model=Page[ActivitiesRead],
-    dependencies=[Depends(get_current_user)],
     description="Returns a paginated list of all actvities to an admin"
 )
-async def get_my_activities(user: Annotated[User, Depends(get_current_user)], session: session):
+async def get_my_activities(user: Annotated[UserPrincipal, Depends(get_current_principal)], session: session):
     activities = await user_service.getUserActivities(user, session)
     return paginate(activities)
 
@@ -487,58 +529,61 @@ async def get_my_activities(user: Annotated[User, Depends(get_current_user)], se
 )
 async def update_profile(user: Annotated[User, Depends(get_current_user)], form_data: Annotated[UserUpdateSchema, Body()], session: session):
     res_user = await user_service.updateUserProfile(user, form_data, session)
-    referralsLv1List = await session.exec(select(UserReferral).where(UserReferral.level == 1).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv2List = await session.exec(select(UserReferral).where(UserReferral.level == 2).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv3List = await session.exec(select(UserReferral).where(UserReferral.level == 3).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv4List = await session.exec(select(UserReferral).where(UserReferral.level == 4).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-    referralsLv5List = await session.exec(select(UserReferral).where(UserReferral.level == 5).where(UserReferral.userId == user.userId).order_by(UserReferral.created).limit(50))
-
-    referralsLv1 = referralsLv1List.all()
-    referralsLv2 = referralsLv2List.all()
-    referralsLv3 = referralsLv3List.all()
-    referralsLv4 = referralsLv4List.all()
-    referralsLv5 = referralsLv5List.all()
-
-    return {
-        "user": res_user,
-        "referralsLv1": referralsLv1,
-        "referralsLv2": referralsLv2,
-        "referralsLv3": referralsLv3,
-        "referralsLv4": referralsLv4,
-        "referralsLv5": referralsLv5,
-    }
+    userResp = await user_service.get_user_with_referrals(res_user, session)
+    return model_response(UserWithReferralsRead, userResp)
 
 @user_router.get(
     "/matrix-pool",
     status_code=status.HTTP_200_OK,
     response_model=Optional[MatrixPoolRead],
-    dependencies=[Depends(get_current_user)],
     description="Returns the current matrix pool"
 )
-async def get_active_matrix_pool(user: Annotated[User, Depends(get_current_user)], session: session):
-    now = datetime.now()
-    mp_db = await session.exec(select(MatrixPool).where(MatrixPool.endDate >= now))
-    matrix = mp_db.first()
-    return matrix
+async def get_active_matrix_pool(user: Annotated[UserPrincipal, Depends(get_current_principal)], session: session):
+    matrix = await matrix_pool_service.get_active_pool(session, create=False)
+    if matrix is None:
+        return None
+    return await MatrixPoolRead.from_pool(matrix, session)
 
 @user_router.get(
     "/my-pool-position",
     status_code=status.HTTP_200_OK,
     response_model=Optional[MatrixUsersRead],
-    dependencies=[Depends(get_current_user)],
     description="Returns the current user matrix pool position"
 )
-async def get_active_matrix_pool(user: Annotated[User, Depends(get_current_user)], session: session):
-    now = datetime.now()
-    mp_db = await session.exec(select(MatrixPool).where(MatrixPool.endDate >= now))
-    matrix = mp_db.first()
+async def get_active_matrix_pool(user: Annotated[UserPrincipal, Depends(get_current_principal)], session: session):
+    matrixPoolUid = await matrix_pool_service.get_active_pool_uid(session)
     
-    if matrix is None:
+    if matrixPoolUid is None:
         raise MatrixPoolNotFound()
     
-    mp_db = await session.exec(select(MatrixPoolUsers).where(MatrixPoolUsers.userId == user.userId).where(MatrixPoolUsers.matrixPoolUid == matrix.uid))
+    mp_db = await session.exec(select(MatrixPoolUsers).where(MatrixPoolUsers.userId == user.userId).where(MatrixPoolUsers.matrixPoolUid == matrixPoolUid))
     matrix_user = mp_db.first()
     return matrix_user
 
+@user_router.get(
+    "/matrix-pool/board",
+    status_code=status.HTTP_200_OK,
+    response_model=MatrixPoolBoardRead,
+    description="Returns the live top `limit` standings of the current matrix pool from the leaderboard cache"
+)
+async def get_matrix_pool_board(user: Annotated[UserPrincipal, Depends(get_current_principal)], session: session, limit: Annotated[int, Query(ge=1, le=100)] = 20):
+    return await matrix_pool_service.get_live_board(limit, session)
 
+@user_router.get(
+    "/my-pool-position/live",
+    status_code=status.HTTP_200_OK,
+    response_model=Optional[MatrixPoolStandingRead],
+    description="Returns the current user's live matrix pool position from the leaderboard cache"
+)
+async def get_my_live_pool_position(user: Annotated[UserPrincipal, Depends(get_current_principal)], session: session):
+    return await matrix_pool_service.get_live_position(user.userId, session)
 
+@user_router.get(
+    "/matrix-pool/history",
+    status_code=status.HTTP_200_OK,
+    response_model=Page[MatrixPoolSnapshotRead],
+    description="Returns the current user's final standings in past matrix pools"
+)
+async def get_my_pool_history(user: Annotated[UserPrincipal, Depends(get_current_principal)], session: session):
+    history = await matrix_pool_service.get_pool_history(user.userId, session)
+    return paginate(history)
@@ -3,7 +3,6 @@ from concurrent.futures import ThreadPoolExecutor
 import json
 from typing import Annotated
 from celery import Celery
-from celery.schedules import crontab
 from fastapi import Depends
 # from src.celery_beat import TemplateScheduleSQLRepository
 from src.config.settings import Config
@@ -48,10 +47,6 @@ celery_app.conf.beat_schedule = {
         'task': 'check_and_update_balances',
         'schedule': 60
     },
-    'run_create_matrix_pool': {
-        'task': 'run_create_matrix_pool',
-        'schedule': crontab(day_of_week="mon")
-    },
     'run_calculate_users_matrix_pool_share': {
         'task': 'run_calculate_users_matrix_pool_share',
         'schedule': 60 * 30
@@ -16,6 +16,10 @@ class BaseConfig(BaseSettings):
     VERSION: Optional[str] = "v1"
     ACCESS_TOKEN_EXPIRY: Optional[int] = 1800
     DOMAIN: str
+    # JSON list of ranks, or a path to a JSON file, overriding the default rank ladder
+    RANK_TABLE: Optional[str] = None
+    # months of activity partitions kept attached by the daily job, unset keeps every month
+    ACTIVITY_RETENTION_MONTHS: Optional[int] = None
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -9,6 +9,7 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
 
 from src.config.settings import Config
+from src.db.partitions import ensure_activity_partitions
 from src.utils.logger import LOGGER
 
 db_url = str(Config.DATABASE_URL).strip()
@@ -28,6 +29,7 @@ async def init_db() -> None:
         raise Exception("Database Engine is None. Please check if you have configured the database url correctly.")
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        await ensure_activity_partitions(conn)
 
 async def get_session() -> AsyncGenerator[AsyncSession,  None]:
     async with Session() as session:
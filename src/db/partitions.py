@@ -0,0 +1,76 @@
+import re
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from src.utils.logger import LOGGER
+
+ACTIVITIES_TABLE = "activities"
+# how many months of empty partitions are kept ready in front of the current one
+ACTIVITY_PARTITIONS_AHEAD = 2
+ACTIVITY_PARTITION_PATTERN = re.compile(rf"{ACTIVITIES_TABLE}_\d{{4}}_\d{{2}}")
+
+
+def month_start(day: date, offset: int = 0) -> date:
+    month = day.month - 1 + offset
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def activity_partition_name(month: date) -> str:
+    return f"{ACTIVITIES_TABLE}_{month:%Y_%m}"
+
+
+async def _is_partitioned(conn) -> bool:
+    result = await conn.execute(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": ACTIVITIES_TABLE},
+    )
+    return bool(result.scalar())
+
+
+async def ensure_activity_partitions(conn, months_ahead: int = ACTIVITY_PARTITIONS_AHEAD, start: Optional[date] = None) -> None:
+    """
+    Create the monthly partitions of the activities table from `start`, the current month by
+    default, through `months_ahead` months from now. `conn` is a connection or a session.
+    """
+    if not await _is_partitioned(conn):
+        LOGGER.warning(f"{ACTIVITIES_TABLE} is not partitioned yet, run the migrations to convert it")
+        return None
+
+    # created is written in utc, so the months are too
+    today = datetime.utcnow().date()
+    month = month_start(start or today)
+    last = month_start(today, months_ahead)
+    while month <= last:
+        next_month = month_start(month, 1)
+        await conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{activity_partition_name(month)}" PARTITION OF "{ACTIVITIES_TABLE}" '
+            f"FOR VALUES FROM ('{month}') TO ('{next_month}')"
+        ))
+        month = next_month
+
+
+async def detach_activity_partitions(before: date, conn) -> List[str]:
+    """
+    Detach every monthly partition that ends on or before `before`. The partitions stay behind
+    as plain tables to archive or drop, and stop being scanned by the activity feeds.
+    """
+    result = await conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.oid = to_regclass(:table)"
+        ),
+        {"table": ACTIVITIES_TABLE},
+    )
+    cutoff = activity_partition_name(month_start(before))
+
+    detached = []
+    # the names sort chronologically, so anything below the cutoff month is older
+    for name in sorted(result.scalars().all()):
+        if ACTIVITY_PARTITION_PATTERN.fullmatch(name) and name < cutoff:
+            await conn.execute(text(f'ALTER TABLE "{ACTIVITIES_TABLE}" DETACH PARTITION "{name}"'))
+            detached.append(name)
+    return detached
@@ -1,12 +1,18 @@
+import asyncio
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from decimal import Decimal
 import json
-from typing import Optional
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
 import uuid
 import redis.asyncio as aioredis
 from src.apps.accounts.models import User
 from src.config.settings import (
     broker_url,
 )
+from src.utils.bloom import BloomFilter
 from src.utils.logger import LOGGER
 
 # Redis connection pool settings
@@ -15,6 +21,20 @@ REDIS_TIMEOUT = 5
 JTI_EXPIRY = 3600
 VERIFICATION_CODE_EXPIRY = 900  # 15 minutes
 SECURITY_EXPIRY = 2592000  # 1 month
+MATRIX_POOL_BOARD_GRACE = timedelta(days=1)
+USER_READ_EXPIRY = 60
+USER_PRINCIPAL_EXPIRY = 300
+# outlives any request that reads a user, a lapsed generation only makes the next write skip caching
+USER_GENERATION_EXPIRY = 86400
+MATRIX_POOL_ACTIVE_KEY = "matrix_pool:active"
+REVOKED_JTIS_KEY = "revoked_jtis"
+REVOKED_JTIS_CHANNEL = "jti:revoked"
+REVOKED_JTIS_CAPACITY = 10000
+REVOKED_JTIS_REBUILD_INTERVAL = 60
+REFRESH_SESSION_EXPIRY = 604800  # 7 days, the lifetime of a refresh token
+REFRESH_SESSION_ROTATED = 1
+REFRESH_SESSION_UNKNOWN = 0
+REFRESH_SESSION_REUSED = -1
 
 # Initialize Redis with connection pooling
 redis_pool = aioredis.ConnectionPool.from_url(
@@ -26,17 +46,132 @@ redis_client = aioredis.Redis(connection_pool=redis_pool)
 # Blacklisting
 async def add_jti_to_blocklist(jti: str) -> None:
     """Adds a JTI (JWT ID) to the Redis blocklist with an expiry."""
-    # Use the 'set' command with an expiry to add the JTI to the blocklist
-    await redis_client.set(jti, "", ex=JTI_EXPIRY)
+    now = time.time()
+    # the key answers lookups, the sorted set lets every process rebuild its bloom filter
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.set(jti, "", ex=JTI_EXPIRY)
+        pipe.zadd(REVOKED_JTIS_KEY, {jti: now + JTI_EXPIRY})
+        pipe.zremrangebyscore(REVOKED_JTIS_KEY, "-inf", now)
+        pipe.publish(REVOKED_JTIS_CHANNEL, jti)
+        await pipe.execute()
+    revoked_tokens.add(jti)
 
 async def token_in_blocklist(jti: str) -> bool:
     """Checks if a JTI (JWT ID) is in the Redis blocklist."""
-    
+    if not revoked_tokens.might_contain(jti):
+        return False
+
     # Use 'exists' instead of 'get' for better performance
     is_blocked = await redis_client.exists(jti)
     LOGGER.debug(f"Token is blocked: {is_blocked == 1}")
     return is_blocked == 1
 
+
+class RevokedTokenFilter:
+    """
+    A bloom filter of the revoked JTIs kept in process, fed by pub/sub and rebuilt from redis
+    every so often, so only possible hits cost a redis round trip. Until the first rebuild,
+    and after losing the subscription, every lookup goes to redis.
+    """
+
+    def __init__(self):
+        self._bloom: Optional[BloomFilter] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def add(self, jti: str) -> None:
+        if self._bloom is not None:
+            self._bloom.add(jti)
+
+    def might_contain(self, jti: str) -> bool:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return self._bloom is None or jti in self._bloom
+
+    async def _rebuild(self) -> None:
+        await redis_client.zremrangebyscore(REVOKED_JTIS_KEY, "-inf", time.time())
+        jtis = await redis_client.zrange(REVOKED_JTIS_KEY, 0, -1)
+        bloom = BloomFilter(max(2 * len(jtis), REVOKED_JTIS_CAPACITY))
+        for jti in jtis:
+            bloom.add(jti.decode("utf-8"))
+        self._bloom = bloom
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                # subscribe before reading the set so nothing revoked in between is missed
+                await pubsub.subscribe(REVOKED_JTIS_CHANNEL)
+                await self._rebuild()
+                rebuilt = time.monotonic()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        self.add(message["data"].decode("utf-8"))
+                    if time.monotonic() - rebuilt > REVOKED_JTIS_REBUILD_INTERVAL:
+                        # drops expired JTIs, which a bloom filter cannot remove
+                        await self._rebuild()
+                        rebuilt = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._bloom = None
+                LOGGER.error(e)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+revoked_tokens = RevokedTokenFilter()
+
+
+# Refresh sessions, one hash per user mapping each session id to the jti of its newest refresh token
+def _refresh_sessions_key(userId: str) -> str:
+    return f"user:{userId}:refresh_sessions"
+
+
+_rotate_refresh_session = redis_client.register_script("""
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if not current then
+    return 0
+end
+if current ~= ARGV[2] then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    return -1
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+""")
+
+
+async def add_refresh_session(userId: str, sessionId: str, jti: str) -> None:
+    key = _refresh_sessions_key(userId)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(key, sessionId, jti)
+        pipe.expire(key, REFRESH_SESSION_EXPIRY)
+        await pipe.execute()
+
+
+async def rotate_refresh_session(userId: str, sessionId: str, jti: str, new_jti: str) -> int:
+    """
+    Swap the session's refresh token `jti` for `new_jti` atomically. Presenting a token the
+    session has already rotated past means it was copied, so the whole session is revoked and
+    REFRESH_SESSION_REUSED returned
+    """
+    return int(await _rotate_refresh_session(
+        keys=[_refresh_sessions_key(userId)],
+        args=[sessionId, jti, new_jti, REFRESH_SESSION_EXPIRY],
+    ))
+
+
+async def revoke_refresh_session(userId: str, sessionId: str) -> None:
+    await redis_client.hdel(_refresh_sessions_key(userId), sessionId)
+
+
+async def revoke_refresh_sessions(userId: str) -> None:
+    """Log a user out everywhere, no refresh token of theirs can be exchanged afterwards."""
+    await redis_client.delete(_refresh_sessions_key(userId))
+
 async def add_level_referral(userId: str, level: int, referralId: str, balance: Decimal, name: Optional[str]):
     key = f"user:{userId}:level:{level}"
     
@@ -73,10 +208,306 @@ async def get_level_referrers(userId: str, level: int):
     return []
     
     
+def _user_read_key(userId: str) -> str:
+    return f"user:{userId}:me"
+
+
+def _user_principal_key(userId: str) -> str:
+    return f"user:{userId}:principal"
+
+
+def _user_generation_key(userId: str) -> str:
+    return f"user:{userId}:generation"
+
+
+# cache a user read only if no invalidation happened since the reader took its generation
+_set_user_cache = redis_client.register_script("""
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+""")
+
+
+async def _get_user_cache(key: str, userId: str) -> Tuple[Optional[bytes], int]:
+    value, generation = await redis_client.mget(key, _user_generation_key(userId))
+    return value, int(generation or 0)
+
+
+async def get_user_read(userId: str) -> Tuple[Optional[bytes], int]:
+    """
+    Return the cached, already serialised /users/me document of a user and the user's cache
+    generation, which has to be passed to `set_user_read` when the document is rebuilt
+    """
+    return await _get_user_cache(_user_read_key(userId), userId)
+
+
+async def set_user_read(userId: str, payload: bytes, generation: int) -> None:
+    await _set_user_cache(
+        keys=[_user_read_key(userId), _user_generation_key(userId)],
+        args=[generation, payload, USER_READ_EXPIRY],
+    )
+
+
+async def get_user_principal(userId: str) -> Tuple[Optional[dict], int]:
+    principal, generation = await _get_user_cache(_user_principal_key(userId), userId)
+    if principal is None:
+        return None, generation
+    return json.loads(principal.decode("utf-8")), generation
+
+
+async def set_user_principal(userId: str, principal: dict, generation: int) -> None:
+    await _set_user_cache(
+        keys=[_user_principal_key(userId), _user_generation_key(userId)],
+        args=[generation, json.dumps(principal), USER_PRINCIPAL_EXPIRY],
+    )
+
+
+async def invalidate_user_reads(*userIds: str) -> None:
+    """
+    Drop the cached /users/me documents and principals of the given users and bump their
+    generation, so a read that loaded the old row before the write committed cannot put it back
+    """
+    if not userIds:
+        return None
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for userId in userIds:
+            pipe.incr(_user_generation_key(userId))
+            pipe.expire(_user_generation_key(userId), USER_GENERATION_EXPIRY)
+        pipe.delete(*[_user_read_key(userId) for userId in userIds], *[_user_principal_key(userId) for userId in userIds])
+        await pipe.execute()
+
+
+def _matrix_pool_board_key(poolUid: uuid.UUID) -> str:
+    return f"matrix_pool:{poolUid}:board"
+
+
+def _matrix_pool_names_key(poolUid: uuid.UUID) -> str:
+    return f"matrix_pool:{poolUid}:names"
+
+
+async def set_active_matrix_pool(poolUid: uuid.UUID, endDate: datetime) -> None:
+    """Remember the active pool id until the pool ends so readers can skip the time-range scan."""
+    ttl = int((endDate - datetime.now()).total_seconds())
+    if ttl <= 0:
+        return None
+    await redis_client.set(MATRIX_POOL_ACTIVE_KEY, str(poolUid), ex=ttl)
+
+
+async def get_active_matrix_pool_uid() -> Optional[uuid.UUID]:
+    poolUid = await redis_client.get(MATRIX_POOL_ACTIVE_KEY)
+    if poolUid is None:
+        return None
+    return uuid.UUID(poolUid.decode("utf-8"))
+
+
+async def incr_matrix_pool_referrals(poolUid: uuid.UUID, endDate: datetime, userId: str, name: Optional[str], amount: int = 1) -> None:
+    """ZINCRBY the member's referral count on the pool leaderboard."""
+    board_key = _matrix_pool_board_key(poolUid)
+    names_key = _matrix_pool_names_key(poolUid)
+
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.zincrby(board_key, amount, userId)
+    if name:
+        pipe.hset(names_key, userId, name)
+    pipe.expireat(board_key, endDate + MATRIX_POOL_BOARD_GRACE)
+    pipe.expireat(names_key, endDate + MATRIX_POOL_BOARD_GRACE)
+    await pipe.execute()
+
+
+async def sync_matrix_pool_board(poolUid: uuid.UUID, endDate: datetime, members: Dict[str, Tuple[int, Optional[str]]]) -> None:
+    """Rebuild the pool leaderboard from the database, `members` maps userId to (referralsAdded, name)."""
+    board_key = _matrix_pool_board_key(poolUid)
+    names_key = _matrix_pool_names_key(poolUid)
+    names = {userId: name for userId, (_, name) in members.items() if name}
+
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(board_key, names_key)
+    if members:
+        pipe.zadd(board_key, {userId: referrals for userId, (referrals, _) in members.items()})
+        pipe.expireat(board_key, endDate + MATRIX_POOL_BOARD_GRACE)
+    if names:
+        pipe.hset(names_key, mapping=names)
+        pipe.expireat(names_key, endDate + MATRIX_POOL_BOARD_GRACE)
+    await pipe.execute()
+
+
+async def matrix_pool_board_exists(poolUid: uuid.UUID) -> bool:
+    return await redis_client.exists(_matrix_pool_board_key(poolUid)) == 1
+
+
+async def get_matrix_pool_position(poolUid: uuid.UUID, userId: str) -> Optional[dict]:
+    """Return the member's live 1-based position, referral count and name, or None if not on the board."""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zrevrank(_matrix_pool_board_key(poolUid), userId)
+    pipe.zscore(_matrix_pool_board_key(poolUid), userId)
+    pipe.hget(_matrix_pool_names_key(poolUid), userId)
+    rank, score, name = await pipe.execute()
+
+    if rank is None:
+        return None
+    return {
+        "matrixPoolUid": poolUid,
+        "userId": userId,
+        "name": name.decode("utf-8") if name else None,
+        "referralsAdded": int(score),
+        "position": rank + 1,
+    }
+
+
+async def get_matrix_pool_board(poolUid: uuid.UUID, limit: int) -> List[dict]:
+    """Return the top `limit` members of the pool leaderboard."""
+    members = await redis_client.zrevrange(_matrix_pool_board_key(poolUid), 0, limit - 1, withscores=True)
+    if not members:
+        return []
+
+    names = await redis_client.hmget(_matrix_pool_names_key(poolUid), [userId for userId, _ in members])
+    return [
+        {
+            "matrixPoolUid": poolUid,
+            "userId": userId.decode("utf-8"),
+            "name": name.decode("utf-8") if name else None,
+            "referralsAdded": int(score),
+            "position": position,
+        }
+        for position, ((userId, score), name) in enumerate(zip(members, names), start=1)
+    ]
+
+
 async def get_sui_usd_price():
     price = await redis_client.get("sui_price")
     return Decimal(json.loads(price.decode("utf-8")))
 
+USER_EVENTS_CHANNEL_PREFIX = "events:user:"
+BROADCAST_EVENTS_CHANNEL = "events:broadcast"
+USER_EVENTS_QUEUE_SIZE = 100
+
+
+def _sse_frame(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, default=str, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+async def publish_events(events: List[Tuple[Optional[str], str, dict]]) -> None:
+    """
+    Publish `(userId, event, data)` deltas as ready to send server-sent event frames, a
+    `None` userId goes to every connected client
+    """
+    if not events:
+        return None
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for userId, event, data in events:
+            channel = BROADCAST_EVENTS_CHANNEL if userId is None else f"{USER_EVENTS_CHANNEL_PREFIX}{userId}"
+            pipe.publish(channel, _sse_frame(event, data))
+        await pipe.execute()
+
+
+class UserEventHub:
+    """
+    A single pattern subscription per process, fanned out to the event stream connections of
+    that process, so open streams do not each hold a redis connection
+    """
+
+    def __init__(self):
+        self._queues: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._listener: Optional[asyncio.Task] = None
+
+    def _deliver(self, channel: str, frame: bytes) -> None:
+        if channel == BROADCAST_EVENTS_CHANNEL:
+            queues = set().union(*self._queues.values())
+        else:
+            queues = self._queues.get(channel.removeprefix(USER_EVENTS_CHANNEL_PREFIX), set())
+        for queue in list(queues):
+            if queue.full():
+                # a slow client loses its oldest delta rather than stalling everyone else
+                queue.get_nowait()
+            queue.put_nowait(frame)
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.psubscribe("events:*")
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        self._deliver(message["channel"].decode("utf-8"), message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER.error(e)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    @asynccontextmanager
+    async def subscribe(self, userId: str):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=USER_EVENTS_QUEUE_SIZE)
+        self._queues[userId].add(queue)
+        try:
+            yield queue
+        finally:
+            self._queues[userId].discard(queue)
+            if not self._queues[userId]:
+                del self._queues[userId]
+
+
+user_event_hub = UserEventHub()
+
+CACHE_INVALIDATION_CHANNEL = "cache:invalidate"
+
+
+async def publish_cache_invalidation(name: str) -> None:
+    """Tell every process to drop its local copy of the cache called `name`."""
+    await redis_client.publish(CACHE_INVALIDATION_CHANNEL, name)
+
+
+class CacheInvalidationListener:
+    """
+    One subscription per process that drops process-local caches when any process publishes
+    their name, every cache is dropped after a reconnect since messages may have been missed
+    """
+
+    def __init__(self):
+        self._callbacks: Dict[str, List[Callable[[], None]]] = defaultdict(list)
+        self._listener: Optional[asyncio.Task] = None
+
+    def register(self, name: str, callback: Callable[[], None]) -> None:
+        self._callbacks[name].append(callback)
+
+    def _drop(self, names) -> None:
+        for name in names:
+            for callback in self._callbacks.get(name, []):
+                callback()
+
+    def start(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                self._drop(list(self._callbacks))
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        self._drop([message["data"].decode("utf-8")])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER.error(e)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+cache_invalidations = CacheInvalidationListener()
+
 # async def save_addresses(user: User):
 #     key = f"wallet"
 #     data = {
@@ -1,9 +1,13 @@
 import pprint
+import zlib
+from typing import Callable, Iterable, Optional
+
 from fastapi import FastAPI
 from fastapi.requests import Request
 from fastapi.responses import RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from starlette.datastructures import MutableHeaders
 from src.config.settings import Config
 import time
 import logging
@@ -14,6 +18,11 @@ from rollbar.logger import RollbarHandler
 
 from src.utils.logger import LOGGER
 
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 logger.disabled = True
@@ -26,6 +35,138 @@ rollbar.init(
     handler='async',
 )
 
+COMPRESSION_MINIMUM_SIZE = 1024
+# path prefixes that are always sent uncompressed, single routes use the `no_compression` decorator
+COMPRESSION_EXCLUDED_PATHS: tuple = ()
+UNCOMPRESSIBLE_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip", "application/gzip")
+
+
+def no_compression(endpoint: Callable) -> Callable:
+    """
+    Opt a route out of response compression, for streamed responses whose chunks have to reach
+    the client as they are produced instead of waiting in the compressor
+    """
+    endpoint.__no_compression__ = True
+    return endpoint
+
+
+class _Encoder:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=4)
+        else:
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    for encoding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Brotli or gzip compression negotiated on `Accept-Encoding`. Bodies under `minimum_size`,
+    already encoded or uncompressible responses, excluded paths and routes marked with
+    `no_compression` are passed through untouched
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE, excluded_paths: Iterable[str] = ()):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.excluded_paths = tuple(excluded_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.excluded_paths):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        encoding = negotiate_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        encoder: Optional[_Encoder] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if encoder is None:
+                response_headers = MutableHeaders(raw=start_message["headers"])
+                content_type = response_headers.get("content-type", "")
+                endpoint = scope.get("endpoint")
+                if (
+                    "content-encoding" in response_headers
+                    or content_type.startswith(UNCOMPRESSIBLE_TYPES)
+                    or getattr(endpoint, "__no_compression__", False)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                encoder = _Encoder(encoding)
+                response_headers["Content-Encoding"] = encoding
+                response_headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del response_headers["Content-Length"]
+                    body = encoder.compress(body)
+                else:
+                    body = encoder.compress(body) + encoder.finish()
+                    response_headers["Content-Length"] = str(len(body))
+                await send(start_message)
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            body = encoder.compress(body)
+            if not more_body:
+                body += encoder.finish()
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
 def register_middleware(app: FastAPI):
 
     app.middleware(
@@ -80,4 +221,10 @@ def register_middleware(app: FastAPI):
             "*",
             "sui-bison-be-188876f9767b.herokuapp.com",   
         ],
-    )
\ No newline at end of file
+    )
+
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_MINIMUM_SIZE,
+        excluded_paths=COMPRESSION_EXCLUDED_PATHS,
+    )
@@ -1,95 +1,162 @@
+import bisect
+import json
 from decimal import Decimal
-from typing import List
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Sequence, Tuple
 
+import numpy as np
 
 from src.apps.accounts.models import MatrixPoolUsers, UserReferral
+from src.config.settings import Config
 from src.db.redis import get_sui_usd_price
 from src.utils.logger import LOGGER
 
 
-def get_rank(tteamVolume: Decimal, tdeposit: Decimal, referrals: Decimal, usd__price):
-    rank_earnings = Decimal(0.00)
-    rank = None
+class Rank(NamedTuple):
+    name: str
+    min_volume: Decimal
+    max_volume: Optional[Decimal]
+    min_deposit: Decimal
+    min_referrals: int
+    earnings: Decimal
+
+
+DEFAULT_RANKS = [
+    {"name": "Leader", "min_volume": 1000, "max_volume": 5000, "min_deposit": 50, "min_referrals": 3, "earnings": 25},
+    {"name": "Bison King", "min_volume": 5000, "max_volume": 20000, "min_deposit": 100, "min_referrals": 5, "earnings": 100},
+    {"name": "Bison Hon", "min_volume": 20000, "max_volume": 100000, "min_deposit": 500, "min_referrals": 10, "earnings": 250},
+    {"name": "Accumulator", "min_volume": 100000, "max_volume": 250000, "min_deposit": 2000, "min_referrals": 10, "earnings": 1000},
+    {"name": "Bison Diamond", "min_volume": 250000, "max_volume": 500000, "min_deposit": 5000, "min_referrals": 10, "earnings": 3000},
+    {"name": "Bison Legend", "min_volume": 500000, "max_volume": 1000000, "min_deposit": 10000, "min_referrals": 10, "earnings": 5000},
+    # No upper limit for this rank
+    {"name": "Supreme Bison", "min_volume": 1000000, "max_volume": None, "min_deposit": 150000, "min_referrals": 10, "earnings": 7000},
+]
+
+
+class RankTable:
+    """
+    Precompiled rank ladder. Ranks are sorted by `min_volume` so the volume band of a
+    user is found with a bisect instead of scanning every rank, and the thresholds are
+    kept as numpy arrays for ranking many users at once. The arrays hold the `Decimal`
+    thresholds themselves so both paths agree exactly at the band edges.
+    """
+
+    def __init__(self, ranks: Sequence[dict]):
+        parsed = sorted(
+            (
+                Rank(
+                    name=r["name"],
+                    min_volume=Decimal(str(r["min_volume"])),
+                    max_volume=Decimal(str(r["max_volume"])) if r.get("max_volume") is not None else None,
+                    min_deposit=Decimal(str(r["min_deposit"])),
+                    min_referrals=int(r["min_referrals"]),
+                    earnings=Decimal(str(r["earnings"])),
+                )
+                for r in ranks
+            ),
+            key=lambda r: r.min_volume,
+        )
+        self.ranks: Tuple[Rank, ...] = tuple(parsed)
+        self.min_volumes: List[Decimal] = [r.min_volume for r in parsed]
+
+        self._min_volume = np.array(self.min_volumes, dtype=object)
+        self._max_volume = np.array([r.max_volume if r.max_volume is not None else Decimal("Infinity") for r in parsed], dtype=object)
+        self._min_deposit = np.array([r.min_deposit for r in parsed], dtype=object)
+        self._min_referrals = np.array([r.min_referrals for r in parsed], dtype=object)
+
+    def lookup(self, team_volume: Decimal, deposit: Decimal, referrals: Decimal) -> Optional[Rank]:
+        """Return the rank for usd denominated volume and deposit, or None."""
+        index = bisect.bisect_right(self.min_volumes, team_volume) - 1
+        if index < 0:
+            return None
+
+        r = self.ranks[index]
+        if r.max_volume is not None and team_volume >= r.max_volume:
+            return None
+        if deposit < r.min_deposit or referrals < r.min_referrals:
+            return None
+        return r
+
+    def lookup_many(self, team_volumes, deposits, referrals) -> np.ndarray:
+        """
+        Vectorized `lookup` over arrays of usd denominated volumes, deposits and
+        referral counts. Returns the index of each user's rank in `self.ranks`,
+        or -1 where the user does not qualify for any rank.
+        """
+        team_volumes = np.asarray(team_volumes, dtype=object)
+        deposits = np.asarray(deposits, dtype=object)
+        referrals = np.asarray(referrals, dtype=object)
+
+        index = np.searchsorted(self._min_volume, team_volumes, side="right") - 1
+        band = np.clip(index, 0, None)
+        qualified = (
+            (index >= 0)
+            & (team_volumes < self._max_volume[band])
+            & (deposits >= self._min_deposit[band])
+            & (referrals >= self._min_referrals[band])
+        )
+        return np.where(qualified, index, -1)
+
+
+def load_rank_table(source: Optional[str] = None) -> RankTable:
+    """
+    Build the rank table from `source`, which may be a JSON list of ranks or a path
+    to a JSON file holding one. Falls back to the default ladder when no source is
+    configured or it cannot be read.
+    """
+    source = source if source is not None else Config.RANK_TABLE
+    if not source:
+        return RankTable(DEFAULT_RANKS)
 
+    try:
+        path = Path(source)
+        raw = path.read_text() if not source.lstrip().startswith("[") and path.is_file() else source
+        return RankTable(json.loads(raw))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        LOGGER.error(f"Invalid rank table configuration, using defaults: {e}")
+        return RankTable(DEFAULT_RANKS)
+
+
+RANK_TABLE = load_rank_table()
+
+
+def reload_rank_table(source: Optional[str] = None) -> RankTable:
+    global RANK_TABLE
+    RANK_TABLE = load_rank_table(source)
+    return RANK_TABLE
+
+
+def get_rank(tteamVolume: Decimal, tdeposit: Decimal, referrals: Decimal, usd__price):
     team_volume = tteamVolume * usd__price
     deposit = tdeposit * usd__price
 
-    ranks = [
-        {
-            "name": "Leader",
-            "min_volume": Decimal(1000),
-            "max_volume": Decimal(5000),
-            "min_deposit": Decimal(50),
-            "min_referrals": 3,
-            "earnings": Decimal(25),
-        },
-        {
-            "name": "Bison King",
-            "min_volume": Decimal(5000),
-            "max_volume": Decimal(20000),
-            "min_deposit": Decimal(100),
-            "min_referrals": 5,
-            "earnings": Decimal(100),
-        },
-        {
-            "name": "Bison Hon",
-            "min_volume": Decimal(20000),
-            "max_volume": Decimal(100000),
-            "min_deposit": Decimal(500),
-            "min_referrals": 10,
-            "earnings": Decimal(250),
-        },
-        {
-            "name": "Accumulator",
-            "min_volume": Decimal(100000),
-            "max_volume": Decimal(250000),
-            "min_deposit": Decimal(2000),
-            "min_referrals": 10,
-            "earnings": Decimal(1000),
-        },
-        {
-            "name": "Bison Diamond",
-            "min_volume": Decimal(250000),
-            "max_volume": Decimal(500000),
-            "min_deposit": Decimal(5000),
-            "min_referrals": 10,
-            "earnings": Decimal(3000),
-        },
-        {
-            "name": "Bison Legend",
-            "min_volume": Decimal(500000),
-            "max_volume": Decimal(1000000),
-            "min_deposit": Decimal(10000),
-            "min_referrals": 10,
-            "earnings": Decimal(5000),
-        },
-        {
-            "name": "Supreme Bison",
-            "min_volume": Decimal(1000000),
-            "max_volume": None,  # No upper limit for this rank
-            "min_deposit": Decimal(150000),
-            "min_referrals": 10,
-            "earnings": Decimal(7000),
-        },
-    ]
-
-    for r in ranks:
-        if (
-            team_volume >= r["min_volume"]
-            and (r["max_volume"] is None or team_volume < r["max_volume"])
-            and deposit >= r["min_deposit"]
-            and referrals >= r["min_referrals"]
-        ):
-            rank = r["name"]
-            rank_earnings = r["earnings"]
-
-        elif rank is not None:
-            break
-
-    if rank:
-        rank_earnings = rank_earnings / usd__price
-
-    return rank_earnings, rank
+    r = RANK_TABLE.lookup(team_volume, deposit, referrals)
+    if r is None:
+        return Decimal(0.00), None
+
+    return r.earnings / usd__price, r.name
+
+
+def get_ranks(team_volumes: Sequence[Decimal], deposits: Sequence[Decimal], referrals: Sequence[Decimal], usd__price) -> List[Tuple[Decimal, Optional[str]]]:
+    """Vectorized `get_rank` returning a (rank_earnings, rank) pair per user."""
+    if not team_volumes:
+        return []
+
+    # usd amounts are multiplied out in Decimal, exactly as `get_rank` does
+    indexes = RANK_TABLE.lookup_many(
+        np.array(team_volumes, dtype=object) * usd__price,
+        np.array(deposits, dtype=object) * usd__price,
+        np.array(referrals, dtype=object),
+    )
+
+    results = []
+    for index in indexes.tolist():
+        if index < 0:
+            results.append((Decimal(0.00), None))
+        else:
+            r = RANK_TABLE.ranks[index]
+            results.append((r.earnings / usd__price, r.name))
+    return results
 
 async def matrix_share(matrixUser: MatrixPoolUsers):
     percentageShare = ( matrixUser.referralsAdded / matrixUser.matrixPool.totalReferrals) * 100
@@ -0,0 +1,53 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, AsyncIterator, Sequence
+from uuid import UUID
+
+from src.apps.accounts.enum import ExportFormat
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def _plain(value: Any) -> Any:
+    """Turn a database value into something both json and csv write without losing precision."""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+async def encode_rows(partitions: AsyncIterator[Sequence[Sequence[Any]]], columns: Sequence[str], fmt: ExportFormat) -> AsyncIterator[bytes]:
+    """
+    Encode row partitions as they arrive from a server side cursor, one chunk per partition,
+    so an export never holds more than one batch in memory
+    """
+    if fmt == ExportFormat.CSV:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        async for rows in partitions:
+            writer.writerows([_plain(value) for value in row] for row in rows)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate(0)
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+        return
+
+    async for rows in partitions:
+        yield "".join(
+            json.dumps({column: _plain(value) for column, value in zip(columns, row)}) + "\n"
+            for row in rows
+        ).encode()
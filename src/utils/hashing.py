@@ -1,8 +1,13 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 import hmac
 import hashlib
+import time
 import urllib.parse
 import uuid
+from typing import Callable, Optional
 from passlib.context import CryptContext
 import jwt
 from src.config.settings import Config
@@ -12,6 +17,13 @@ from init_data_py import InitData
 
 bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated='auto')
 
+# bcrypt is cpu bound, a couple of processes per worker is enough for admin logins
+HASHING_WORKERS = 2
+HASHING_SLOW_WAIT = 1.0
+DECODED_TOKEN_CACHE_SIZE = 10000
+TELEGRAM_VERIFICATION_CACHE_SIZE = 10000
+_decoded_tokens: "OrderedDict[bytes, dict]" = OrderedDict()
+
 def generateHashKey(word: str) -> str:
     """
     The function `generateHashKey` takes a string input, hashes it using bcrypt, and returns the hashed
@@ -43,61 +55,177 @@ def verifyHashKey(word: str, hash: str) -> bool:
     correct = bcrypt_context.verify(word, hash)
     return correct
 
-def verifyTelegramAuthData(telegram_init_data: str, userId: str) -> bool:
-    bot_token=Config.TELEGRAM_TOKEN
-    
-    vals = {k: urllib.parse.unquote(v) for k, v in [s.split('=', 1) for s in telegram_init_data.split('&')]}
-    LOGGER.debug(f"TELEGRAM AUTH VALUES: {vals}")
-    data_check_string = '\n'.join(f"{k}={v}" for k, v in sorted(vals.items()) if k != 'hash')
-    auth_date_check = vals["auth_date"]
-    datetime_object = datetime.fromtimestamp(int(auth_date_check))
-    
-    data_list = data_check_string.strip().split('\n')
-
-    # Create a dictionary to store the parsed data
-    data_dict = {}
-    for pair in data_list:
-        key, value = pair.split('=')
-        data_dict[key] = value
-
-    user_id = data_dict["user"]
-    LOGGER.debug(f"DATETIME: {datetime_object.date()}")
-    LOGGER.debug(f"CURRENT: {datetime.now().date()}")
-    LOGGER.debug(f"TELEGRAM USER ID: {user_id[6:16]}")
-    LOGGER.debug(f"USER ID: {userId}")
-    
-    if userId not in telegram_init_data:
-        raise UnAuthorizedTelegramAccess()
-    
-    if datetime.now().date() > datetime_object.date():
-        raise TelegramAuthDataTokenExpired()
 
-    secret_key = hmac.new("WebAppData".encode(), bot_token.encode(), hashlib.sha256).digest()
-    h = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256)
-    LOGGER.info(h.hexdigest())
-    LOGGER.info(vals['hash'])
-    return h.hexdigest() == vals['hash']    
+class HashingExecutor:
+    """
+    Runs bcrypt in a small process pool so hashing never blocks the event loop. At most one job
+    per worker is in flight, the rest wait their turn on the loop, and the queue depth and wait
+    times are tracked so a login storm shows up in the logs
+    """
+
+    def __init__(self, workers: int = HASHING_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.totalWait = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "averageWait": self.totalWait / self.completed if self.completed else 0.0,
+        }
+
+    async def run(self, fn: Callable, *args):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            self._slots = asyncio.Semaphore(self.workers)
 
-def createAccessToken(user_data: dict, expiry: timedelta = None, refresh: bool = False) -> str:
+        enqueued = time.monotonic()
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        wait = time.monotonic() - enqueued
+        if wait > HASHING_SLOW_WAIT:
+            LOGGER.warning(f"Password hashing waited {wait:.2f}s for a worker: {self.stats()}")
+
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self.totalWait += wait
+            self._slots.release()
+
+
+hashing_executor = HashingExecutor()
+
+
+async def generateHashKeyAsync(word: str) -> str:
+    """`generateHashKey` on the hashing process pool."""
+    return await hashing_executor.run(generateHashKey, word)
+
+
+async def verifyHashKeyAsync(word: str, hash: str) -> bool:
+    """`verifyHashKey` on the hashing process pool."""
+    return await hashing_executor.run(verifyHashKey, word, hash)
+
+class TelegramInitDataVerifier:
+    """
+    Checks Telegram mini app `initData` strings. The HMAC secret is derived from the bot token
+    once, the string is parsed in a single pass and successful checks are remembered by the
+    string's hash until its `auth_date` day is over, when the check would start failing anyway
+    """
+
+    def __init__(self, bot_token: str, cache_size: int = TELEGRAM_VERIFICATION_CACHE_SIZE):
+        self._secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+        self._verified: "OrderedDict[bytes, float]" = OrderedDict()
+        self.cache_size = cache_size
+
+    def _remember(self, key: bytes, expires: float) -> None:
+        self._verified[key] = expires
+        while len(self._verified) > self.cache_size:
+            self._verified.popitem(last=False)
+
+    def verify(self, telegram_init_data: str, userId: str) -> bool:
+        if userId not in telegram_init_data:
+            raise UnAuthorizedTelegramAccess()
+
+        key = hashlib.sha256(telegram_init_data.encode()).digest()
+        expires = self._verified.get(key)
+        if expires is not None:
+            if expires <= time.time():
+                self._verified.pop(key, None)
+                raise TelegramAuthDataTokenExpired()
+            self._verified.move_to_end(key)
+            return True
+
+        fields = {}
+        received_hash = None
+        for pair in telegram_init_data.split("&"):
+            name, _, value = pair.partition("=")
+            if name == "hash":
+                received_hash = value
+            else:
+                fields[name] = urllib.parse.unquote(value)
+
+        try:
+            auth_date = datetime.fromtimestamp(int(fields["auth_date"]))
+        except (KeyError, ValueError):
+            return False
+        if received_hash is None:
+            return False
+
+        # init data stays valid until the end of the day it was issued on
+        expires = datetime.combine(auth_date.date() + timedelta(days=1), datetime.min.time()).timestamp()
+        if expires <= time.time():
+            raise TelegramAuthDataTokenExpired()
+
+        data_check_string = "\n".join(f"{name}={value}" for name, value in sorted(fields.items()))
+        digest = hmac.new(self._secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(digest, received_hash):
+            return False
+
+        self._remember(key, expires)
+        return True
+
+
+telegram_verifier = TelegramInitDataVerifier(Config.TELEGRAM_TOKEN)
+
+
+def verifyTelegramAuthData(telegram_init_data: str, userId: str) -> bool:
+    return telegram_verifier.verify(telegram_init_data, userId)
+
+def createAccessToken(user_data: dict, expiry: timedelta = None, refresh: bool = False, sessionId: Optional[str] = None, jti: Optional[str] = None) -> str:
     payload = {}
     payload["user"] = user_data
     payload["exp"] = datetime.now() + (
         expiry if expiry is not None else timedelta(seconds=Config.ACCESS_TOKEN_EXPIRY)
     )
-    payload["jti"] = str(uuid.uuid4())
+    payload["jti"] = jti if jti is not None else str(uuid.uuid4())
+    payload["refresh"] = refresh
+    if sessionId is not None:
+        payload["sid"] = sessionId
     token = jwt.encode(
         payload=payload, key=Config.TELEGRAM_TOKEN, algorithm=Config.ALGORITHM
     )
     return token
 
 def decodeAccessToken(token: str) -> dict:
+    """
+    Verify and decode a token, verified payloads are kept in a bounded LRU keyed by the token's
+    hash until they expire so a client polling with the same token skips the signature check.
+    The returned payload is shared, do not mutate it.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    token_data = _decoded_tokens.get(key)
+    if token_data is not None:
+        if token_data["exp"] <= time.time():
+            _decoded_tokens.pop(key, None)
+            raise TokenExpired()
+        _decoded_tokens.move_to_end(key)
+        return token_data
+
     try:
         token_data = jwt.decode(
             jwt=token, key=Config.TELEGRAM_TOKEN, algorithms=[Config.ALGORITHM]
         )
-        return token_data
     except jwt.ExpiredSignatureError:
         raise TokenExpired()
     except jwt.PyJWTError as e:
         raise InvalidToken()
+
+    _decoded_tokens[key] = token_data
+    while len(_decoded_tokens) > DECODED_TOKEN_CACHE_SIZE:
+        _decoded_tokens.popitem(last=False)
+    return token_data
     
@@ -0,0 +1,52 @@
+import asyncio
+import hashlib
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response, status
+
+
+class ResponseCache:
+    """
+    Keeps serialised JSON bodies in process for `ttl` seconds, tags them with an ETag and answers
+    `If-None-Match` with a 304 so browsers and the CDN can revalidate polling requests for free
+    """
+
+    def __init__(self, ttl: float, max_age: Optional[int] = None):
+        self.ttl = ttl
+        self.max_age = int(ttl) if max_age is None else max_age
+        self._entries: Dict[str, Tuple[float, bytes, str]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def invalidate(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def _entry(self, key: str, build: Callable[[], Awaitable[bytes]]) -> Tuple[bytes, str]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1], entry[2]
+
+        # one caller rebuilds an expired entry while the others wait for it
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1], entry[2]
+            body = await build()
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            self._entries[key] = (time.monotonic() + self.ttl, body, etag)
+            return body, etag
+
+    async def respond(self, request: Request, key: str, build: Callable[[], Awaitable[bytes]]) -> Response:
+        body, etag = await self._entry(key, build)
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={self.max_age}, stale-while-revalidate={self.max_age}",
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in tags or etag in tags:
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+from src.db.redis import cache_invalidations, publish_cache_invalidation
+
+T = TypeVar("T")
+
+# upper bound on how long a value is trusted should an invalidation be lost
+LOCAL_CACHE_MAX_AGE = timedelta(minutes=10)
+
+
+class LocalCache(Generic[T]):
+    """
+    A single value kept in process until it expires or any process publishes the cache's name on
+    the invalidation channel, for rows that hot paths read on every request but rarely change
+    """
+
+    def __init__(self, name: str, max_age: timedelta = LOCAL_CACHE_MAX_AGE):
+        self.name = name
+        self.max_age = max_age
+        self._value: Optional[T] = None
+        self._expires = datetime.min
+        cache_invalidations.register(name, self.invalidate)
+
+    def invalidate(self) -> None:
+        self._value = None
+
+    async def drop(self) -> None:
+        """Invalidate the value here and in every other process."""
+        self.invalidate()
+        await publish_cache_invalidation(self.name)
+
+    def set(self, value: T, expires: Optional[datetime] = None) -> None:
+        now = datetime.now()
+        self._value = value
+        self._expires = now + self.max_age if expires is None else min(expires, now + self.max_age)
+
+    def peek(self) -> Optional[T]:
+        if self._value is not None and self._expires > datetime.now():
+            return self._value
+        return None
+
+    async def get(self, load: Callable[[], Awaitable[Optional[T]]], expires: Optional[Callable[[T], datetime]] = None) -> Optional[T]:
+        value = self.peek()
+        if value is not None:
+            return value
+
+        cache_invalidations.start()
+        value = await load()
+        if value is not None:
+            self.set(value, expires(value) if expires is not None else None)
+        return value
@@ -0,0 +1,61 @@
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Optional
+
+import orjson
+from fastapi import status
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+
+def _default(value: Any) -> Any:
+    # match pydantic, which writes decimals as strings so no precision is lost
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return value.__pydantic_serializer__.to_python(value, mode="json")
+    raise TypeError
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    Opt-in response class for payloads that are already validated, encoded bytes pass straight
+    through, models use their compiled serializer and anything else goes through orjson
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if isinstance(content, BaseModel):
+            return content.__pydantic_serializer__.to_json(content)
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+@lru_cache(maxsize=None)
+def schema_adapter(schema: Any) -> TypeAdapter:
+    """One compiled validator and serializer per response schema, built on first use."""
+    return TypeAdapter(schema)
+
+
+def model_response(schema: Any, data: Any, status_code: int = status.HTTP_200_OK, exclude: Optional[dict] = None) -> FastJSONResponse:
+    """
+    Validate ORM objects against `schema` once and encode the result in the same pass, skipping
+    jsonable_encoder and the second validation FastAPI runs for a `response_model`
+    """
+    adapter = schema_adapter(schema)
+    content = adapter.dump_json(adapter.validate_python(data, from_attributes=True), exclude=exclude)
+    return FastJSONResponse(content=content, status_code=status_code)
+
+
+def prune_document(document: dict, exclude: Any) -> dict:
+    """Apply a pydantic style `exclude` to a document that has already been serialised."""
+    if isinstance(exclude, (set, frozenset)):
+        exclude = dict.fromkeys(exclude, True)
+
+    pruned = {}
+    for key, value in document.items():
+        rule = exclude.get(key)
+        if rule is True:
+            continue
+        pruned[key] = prune_document(value, rule) if rule and isinstance(value, dict) else value
+    return pruned
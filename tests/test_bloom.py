@@ -0,0 +1,45 @@
+import pytest
+
+from src.utils.bloom import BloomFilter
+
+
+def test_added_items_are_always_found():
+    bloom = BloomFilter(1000)
+    items = [f"jti-{index}" for index in range(1000)]
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+
+
+def test_empty_filter_contains_nothing():
+    bloom = BloomFilter(100)
+
+    assert "jti" not in bloom
+
+
+@pytest.mark.parametrize("error_rate", [0.01, 0.001])
+def test_false_positive_rate_stays_near_target(error_rate):
+    bloom = BloomFilter(2000, error_rate=error_rate)
+    for index in range(2000):
+        bloom.add(f"revoked-{index}")
+
+    false_positives = sum(f"valid-{index}" in bloom for index in range(20000))
+
+    # generous bound, the exact rate depends on the hash of these strings
+    assert false_positives / 20000 < error_rate * 3
+
+
+def test_sizing():
+    bloom = BloomFilter(10000, error_rate=0.001)
+
+    # about 14.4 bits and 10 hashes per item for a 0.1% error rate
+    assert 140000 <= bloom.size <= 150000
+    assert bloom.hashes == 10
+
+
+def test_zero_capacity_is_usable():
+    bloom = BloomFilter(0)
+    bloom.add("jti")
+
+    assert "jti" in bloom
@@ -0,0 +1,90 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+from src.utils.calculations import DEFAULT_RANKS, RankTable, get_rank, get_ranks, load_rank_table
+
+
+@pytest.fixture
+def table():
+    return RankTable(DEFAULT_RANKS)
+
+
+def test_ranks_are_sorted_by_min_volume():
+    table = RankTable(list(reversed(DEFAULT_RANKS)))
+
+    assert [r.name for r in table.ranks] == [r["name"] for r in DEFAULT_RANKS]
+
+
+@pytest.mark.parametrize(
+    "team_volume, deposit, referrals, expected",
+    [
+        (Decimal("999.999999999"), Decimal(50), 3, None),
+        (Decimal(1000), Decimal(50), 3, "Leader"),
+        (Decimal("4999.999999999"), Decimal(50), 3, "Leader"),
+        (Decimal(5000), Decimal(100), 5, "Bison King"),
+        # the next band's requirements apply as soon as its min_volume is reached
+        (Decimal(5000), Decimal(50), 3, None),
+        (Decimal(1000), Decimal("49.999999999"), 3, None),
+        (Decimal(1000), Decimal(50), 2, None),
+        (Decimal(1000000), Decimal(150000), 10, "Supreme Bison"),
+        (Decimal(10) ** 12, Decimal(150000), 10, "Supreme Bison"),
+    ],
+)
+def test_lookup_at_band_edges(table, team_volume, deposit, referrals, expected):
+    rank = table.lookup(team_volume, deposit, Decimal(referrals))
+
+    assert (rank.name if rank is not None else None) == expected
+
+
+def test_lookup_many_matches_lookup(table):
+    volumes = [Decimal("999.999999999"), Decimal(1000), Decimal(5000), Decimal(5000), Decimal(1000000)]
+    deposits = [Decimal(50), Decimal(50), Decimal(100), Decimal(50), Decimal(150000)]
+    referrals = [3, 3, 5, 3, 10]
+
+    indexes = table.lookup_many(volumes, deposits, referrals).tolist()
+
+    for index, volume, deposit, count in zip(indexes, volumes, deposits, referrals):
+        rank = table.lookup(volume, deposit, Decimal(count))
+        assert (table.ranks[index] if index >= 0 else None) == rank
+
+
+@pytest.mark.parametrize("usd_price", [Decimal(1), Decimal("3.7"), Decimal("0.000123")])
+def test_get_ranks_agrees_with_get_rank_at_band_edges(usd_price):
+    volumes, deposits, referrals = [], [], []
+    for r in DEFAULT_RANKS:
+        # sui amounts whose usd value lands exactly on, and just below, each threshold
+        for volume in (Decimal(r["min_volume"]) / usd_price, Decimal(r["min_volume"]) / usd_price - Decimal("0.000000001")):
+            volumes.append(volume)
+            deposits.append(Decimal(r["min_deposit"]) / usd_price)
+            referrals.append(Decimal(r["min_referrals"]))
+
+    expected = [get_rank(v, d, n, usd_price) for v, d, n in zip(volumes, deposits, referrals)]
+
+    assert get_ranks(volumes, deposits, referrals, usd_price) == expected
+
+
+def test_get_ranks_of_no_users():
+    assert get_ranks([], [], [], Decimal(1)) == []
+
+
+def test_get_rank_pays_earnings_in_sui():
+    earnings, rank = get_rank(Decimal(500), Decimal(25), Decimal(3), Decimal(2))
+
+    assert rank == "Leader"
+    assert earnings == Decimal("12.5")
+
+
+def test_load_rank_table_from_json():
+    table = load_rank_table(json.dumps([
+        {"name": "Only", "min_volume": 1, "max_volume": None, "min_deposit": 1, "min_referrals": 0, "earnings": 1},
+    ]))
+
+    assert [r.name for r in table.ranks] == ["Only"]
+
+
+def test_load_rank_table_falls_back_to_defaults():
+    table = load_rank_table("[not json")
+
+    assert [r.name for r in table.ranks] == [r["name"] for r in DEFAULT_RANKS]
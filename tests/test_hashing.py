@@ -0,0 +1,112 @@
+import hashlib
+import hmac
+import time
+import types
+import urllib.parse
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.errors import TelegramAuthDataTokenExpired, UnAuthorizedTelegramAccess
+from src.utils import hashing
+from src.utils.hashing import TelegramInitDataVerifier
+
+BOT_TOKEN = "123456:test-bot-token"
+USER_ID = "987654321"
+
+
+def sign_init_data(fields: dict, bot_token: str = BOT_TOKEN) -> str:
+    """Build an initData string the way Telegram signs it."""
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    data_check_string = "\n".join(f"{name}={value}" for name, value in sorted(fields.items()))
+    digest = hmac.new(secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urllib.parse.urlencode({**fields, "hash": digest})
+
+
+def init_fields(auth_date: datetime = None) -> dict:
+    auth_date = auth_date if auth_date is not None else datetime.now()
+    return {
+        "query_id": "AAHdF6IQAAAAAN0XohDhrOrc",
+        "user": f'{{"id":{USER_ID},"first_name":"Ada","username":"ada"}}',
+        "auth_date": str(int(auth_date.timestamp())),
+    }
+
+
+@pytest.fixture
+def verifier():
+    return TelegramInitDataVerifier(BOT_TOKEN)
+
+
+def test_valid_init_data(verifier):
+    assert verifier.verify(sign_init_data(init_fields()), USER_ID) is True
+
+
+def test_valid_init_data_is_remembered(verifier):
+    init_data = sign_init_data(init_fields())
+    verifier.verify(init_data, USER_ID)
+
+    assert len(verifier._verified) == 1
+    assert verifier.verify(init_data, USER_ID) is True
+
+
+def test_tampered_init_data(verifier):
+    init_data = sign_init_data(init_fields()).replace("Ada", "Eve")
+
+    assert verifier.verify(init_data, USER_ID) is False
+
+
+def test_init_data_signed_for_another_bot(verifier):
+    assert verifier.verify(sign_init_data(init_fields(), bot_token="654321:other-bot"), USER_ID) is False
+
+
+def test_init_data_of_another_user(verifier):
+    with pytest.raises(UnAuthorizedTelegramAccess):
+        verifier.verify(sign_init_data(init_fields()), "111111111")
+
+
+def test_expired_init_data(verifier):
+    init_data = sign_init_data(init_fields(datetime.now() - timedelta(days=1)))
+
+    with pytest.raises(TelegramAuthDataTokenExpired):
+        verifier.verify(init_data, USER_ID)
+
+
+def test_remembered_init_data_expires(verifier, monkeypatch):
+    init_data = sign_init_data(init_fields())
+    verifier.verify(init_data, USER_ID)
+
+    tomorrow = time.time() + timedelta(days=1).total_seconds()
+    monkeypatch.setattr(hashing, "time", types.SimpleNamespace(time=lambda: tomorrow))
+
+    with pytest.raises(TelegramAuthDataTokenExpired):
+        verifier.verify(init_data, USER_ID)
+    assert len(verifier._verified) == 0
+
+
+@pytest.mark.parametrize(
+    "init_data",
+    [
+        f"user=%7B%22id%22%3A{USER_ID}%7D",
+        f"user=%7B%22id%22%3A{USER_ID}%7D&hash=abc",
+        f"user=%7B%22id%22%3A{USER_ID}%7D&auth_date=yesterday&hash=abc",
+        f"user=%7B%22id%22%3A{USER_ID}%7D&auth_date={int(time.time())}",
+        f"{USER_ID}&&==",
+    ],
+)
+def test_malformed_init_data(verifier, init_data):
+    assert verifier.verify(init_data, USER_ID) is False
+
+
+def test_failed_checks_are_not_remembered(verifier):
+    verifier.verify(sign_init_data(init_fields()).replace("Ada", "Eve"), USER_ID)
+
+    assert len(verifier._verified) == 0
+
+
+def test_cache_is_bounded():
+    verifier = TelegramInitDataVerifier(BOT_TOKEN, cache_size=2)
+    for index in range(3):
+        fields = {**init_fields(), "query_id": f"query-{index}"}
+        verifier.verify(sign_init_data(fields), USER_ID)
+
+    assert len(verifier._verified) == 2
@@ -0,0 +1,91 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.db.redis import cache_invalidations
+from src.utils.local_cache import LocalCache
+
+
+@pytest.fixture(autouse=True)
+def no_listener(monkeypatch):
+    # the invalidation subscription is redis' side of the cache, these tests drive it directly
+    monkeypatch.setattr(cache_invalidations, "start", lambda: None)
+
+
+def test_set_and_peek():
+    cache = LocalCache("test:set")
+    assert cache.peek() is None
+
+    cache.set(1)
+
+    assert cache.peek() == 1
+
+
+def test_values_expire():
+    cache = LocalCache("test:expires")
+
+    cache.set(1, expires=datetime.now() - timedelta(seconds=1))
+
+    assert cache.peek() is None
+
+
+def test_expiry_is_capped_at_max_age():
+    cache = LocalCache("test:max_age", max_age=timedelta(0))
+
+    cache.set(1, expires=datetime.now() + timedelta(days=1))
+
+    assert cache.peek() is None
+
+
+def test_get_loads_once():
+    cache = LocalCache("test:get")
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return "value"
+
+    async def read_twice():
+        return await cache.get(load), await cache.get(load)
+
+    assert asyncio.run(read_twice()) == ("value", "value")
+    assert len(loads) == 1
+
+
+def test_get_does_not_cache_missing_values():
+    cache = LocalCache("test:missing")
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return None
+
+    async def read_twice():
+        return await cache.get(load), await cache.get(load)
+
+    assert asyncio.run(read_twice()) == (None, None)
+    assert len(loads) == 2
+
+
+def test_get_uses_the_value_expiry():
+    cache = LocalCache("test:get_expires")
+
+    async def load():
+        return "value"
+
+    asyncio.run(cache.get(load, expires=lambda value: datetime.now() - timedelta(seconds=1)))
+
+    assert cache.peek() is None
+
+
+def test_invalidation_by_name():
+    cache = LocalCache("test:invalidate")
+    other = LocalCache("test:other")
+    cache.set(1)
+    other.set(2)
+
+    cache_invalidations._drop(["test:invalidate"])
+
+    assert cache.peek() is None
+    assert other.peek() == 2
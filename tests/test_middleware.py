@@ -0,0 +1,150 @@
+import asyncio
+import gzip
+
+import pytest
+
+from src import middleware
+from src.middleware import CompressionMiddleware, negotiate_encoding, no_compression
+
+
+@pytest.fixture
+def without_brotli(monkeypatch):
+    monkeypatch.setattr(middleware, "brotli", None)
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("", None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("gzip, deflate", "gzip"),
+        ("GZIP", "gzip"),
+        ("gzip;q=0", None),
+        ("gzip;q=0, *", None),
+        ("gzip;q=bad", None),
+    ],
+)
+def test_negotiate_encoding_without_brotli(without_brotli, accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+def test_negotiate_encoding_falls_back_to_the_wildcard(without_brotli):
+    assert negotiate_encoding("*") == "gzip"
+    assert negotiate_encoding("deflate, *;q=0.1") == "gzip"
+
+
+@pytest.mark.skipif(middleware.brotli is None, reason="brotli is not installed")
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, br", "br"),
+        ("br;q=0, gzip", "gzip"),
+        ("br;q=0.5, gzip;q=1.0", "br"),
+        ("*", "br"),
+    ],
+)
+def test_negotiate_encoding_prefers_brotli(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+def make_app(chunks, content_type=b"application/json", endpoint=None):
+    async def app(scope, receive, send):
+        if endpoint is not None:
+            scope["endpoint"] = endpoint
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type)]})
+        for index, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": index < len(chunks) - 1})
+    return app
+
+
+def call(app, accept_encoding="gzip", path="/v1/users/me"):
+    scope = {"type": "http", "path": path, "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    headers = dict(messages[0]["headers"])
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return headers, body, messages[1:]
+
+
+def test_large_bodies_are_gzipped(without_brotli):
+    payload = b'{"user": "x"}' * 200
+
+    headers, body, _ = call(CompressionMiddleware(make_app([payload])))
+
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"accept-encoding" in headers[b"vary"].lower()
+    assert int(headers[b"content-length"]) == len(body)
+    assert gzip.decompress(body) == payload
+
+
+def test_small_bodies_are_passed_through(without_brotli):
+    headers, body, _ = call(CompressionMiddleware(make_app([b"{}"])))
+
+    assert b"content-encoding" not in headers
+    assert body == b"{}"
+
+
+def test_streamed_bodies_are_compressed_chunk_by_chunk(without_brotli):
+    chunks = [b"line %d\n" % index for index in range(50)]
+
+    headers, body, messages = call(CompressionMiddleware(make_app(chunks)))
+
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    assert len(messages) == len(chunks)
+    assert gzip.decompress(body) == b"".join(chunks)
+
+
+def test_event_streams_are_not_compressed(without_brotli):
+    chunks = [b"event: ping\ndata: {}\n\n"] * 100
+
+    headers, body, _ = call(CompressionMiddleware(make_app(chunks, content_type=b"text/event-stream")))
+
+    assert b"content-encoding" not in headers
+    assert body == b"".join(chunks)
+
+
+def test_no_compression_routes_are_passed_through(without_brotli):
+    @no_compression
+    async def export():
+        pass
+
+    chunks = [b"id,name\n" * 200, b"1,a\n" * 200]
+
+    headers, body, _ = call(CompressionMiddleware(make_app(chunks, content_type=b"text/csv", endpoint=export)))
+
+    assert b"content-encoding" not in headers
+    assert body == b"".join(chunks)
+
+
+def test_excluded_paths_are_passed_through(without_brotli):
+    payload = b"x" * 5000
+
+    headers, body, _ = call(CompressionMiddleware(make_app([payload]), excluded_paths=["/v1/static"]), path="/v1/static/a")
+
+    assert b"content-encoding" not in headers
+    assert body == payload
+
+
+def test_clients_without_accept_encoding_get_plain_bodies(without_brotli):
+    payload = b"x" * 5000
+
+    headers, body, _ = call(CompressionMiddleware(make_app([payload])), accept_encoding="")
+
+    assert b"content-encoding" not in headers
+    assert body == payload
+
+
+def test_streamed_routes_opt_out_of_compression():
+    from src.apps.accounts.views import export_activities, export_users, user_events
+
+    for endpoint in (export_users, export_activities, user_events):
+        assert getattr(endpoint, "__no_compression__", False), endpoint.__name__
@@ -0,0 +1,75 @@
+from decimal import Decimal
+
+import orjson
+import pytest
+from pydantic import BaseModel
+
+from src.utils.responses import FastJSONResponse, model_response, prune_document
+
+DOCUMENT = {
+    "userId": "42",
+    "wallet": {"address": "0x1", "balance": "1.5"},
+    "staking": {"deposit": "10", "roi": "0.01"},
+    "referrer": None,
+}
+
+
+def test_prune_top_level_keys():
+    assert prune_document(DOCUMENT, {"wallet": True, "staking": True}) == {"userId": "42", "referrer": None}
+
+
+def test_prune_accepts_a_set():
+    assert prune_document(DOCUMENT, {"wallet", "staking", "referrer"}) == {"userId": "42"}
+
+
+def test_prune_nested_keys():
+    pruned = prune_document(DOCUMENT, {"wallet": {"balance": True}})
+
+    assert pruned["wallet"] == {"address": "0x1"}
+    assert pruned["staking"] == DOCUMENT["staking"]
+
+
+def test_prune_nested_rule_on_a_missing_section():
+    assert prune_document(DOCUMENT, {"referrer": {"name": True}})["referrer"] is None
+
+
+def test_prune_does_not_mutate_the_document():
+    prune_document(DOCUMENT, {"wallet": {"balance": True}})
+
+    assert DOCUMENT["wallet"] == {"address": "0x1", "balance": "1.5"}
+
+
+def test_prune_matches_pydantic_exclude():
+    class Wallet(BaseModel):
+        address: str
+        balance: Decimal
+
+    class User(BaseModel):
+        userId: str
+        wallet: Wallet
+
+    user = User(userId="42", wallet=Wallet(address="0x1", balance=Decimal("1.5")))
+    exclude = {"wallet": {"balance": True}}
+
+    assert prune_document(orjson.loads(user.model_dump_json()), exclude) == orjson.loads(user.model_dump_json(exclude=exclude))
+
+
+@pytest.mark.parametrize(
+    "content, expected",
+    [
+        (b'{"a":1}', b'{"a":1}'),
+        ({"amount": Decimal("1.10")}, b'{"amount":"1.10"}'),
+    ],
+)
+def test_fast_json_response_render(content, expected):
+    assert FastJSONResponse(content=content).body == expected
+
+
+def test_model_response_applies_exclude():
+    class Wallet(BaseModel):
+        address: str
+        balance: Decimal
+
+    response = model_response(Wallet, {"address": "0x1", "balance": Decimal(1)}, exclude={"balance": True})
+
+    assert orjson.loads(response.body) == {"address": "0x1"}
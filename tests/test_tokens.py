@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+import pytest
+
+from src.apps.accounts.dependencies import AccessTokenBearer, RefreshTokenBearer, TokenBearer
+from src.errors import AccessTokenRequired, RefreshTokenRequired, TokenExpired
+from src.utils.hashing import createAccessToken, decodeAccessToken
+
+USER = {"userId": "987654321"}
+
+
+def test_token_round_trip():
+    token_data = decodeAccessToken(createAccessToken(USER, sessionId="session"))
+
+    assert token_data["user"] == USER
+    assert token_data["refresh"] is False
+    assert token_data["sid"] == "session"
+
+
+def test_expired_token():
+    with pytest.raises(TokenExpired):
+        decodeAccessToken(createAccessToken(USER, expiry=timedelta(seconds=-1)))
+
+
+def test_access_bearer_rejects_refresh_tokens():
+    token_data = decodeAccessToken(createAccessToken(USER, refresh=True))
+
+    with pytest.raises(AccessTokenRequired):
+        AccessTokenBearer().verify_token_data(token_data)
+
+
+def test_refresh_bearer_rejects_access_tokens():
+    token_data = decodeAccessToken(createAccessToken(USER))
+
+    with pytest.raises(RefreshTokenRequired):
+        RefreshTokenBearer().verify_token_data(token_data)
+
+
+def test_tokens_without_the_refresh_claim_are_access_tokens():
+    token_data = {"user": USER, "jti": "jti"}
+
+    assert AccessTokenBearer().verify_token_data(token_data) is None
+    with pytest.raises(RefreshTokenRequired):
+        RefreshTokenBearer().verify_token_data(token_data)
+
+
+def test_token_bearer_is_abstract():
+    with pytest.raises(TypeError):
+        TokenBearer()